@@ -22,16 +22,67 @@ B3LB_NO_SLIDES_TEXT = env.str('B3LB_NO_SLIDES_TEXT', default='<default>')
 
 B3LB_CACHE_NML_PATTERN = env.str('B3LB_CACHE_NML_PATTERN', default='NML#{}')
 B3LB_CACHE_NML_TIMEOUT = env.int('B3LB_CACHE_NML_TIMEOUT', default=30)
+B3LB_CACHE_SML_PATTERN = env.str('B3LB_CACHE_SML_PATTERN', default='SML#{}')
+B3LB_CACHE_SML_TIMEOUT = env.int('B3LB_CACHE_SML_TIMEOUT', default=15)
+B3LB_CACHE_METRICS_PATTERN = env.str('B3LB_CACHE_METRICS_PATTERN', default='METRICS#{}')
+B3LB_CACHE_METRICS_TIMEOUT = env.int('B3LB_CACHE_METRICS_TIMEOUT', default=10)
+B3LB_CACHE_STATS_PATTERN = env.str('B3LB_CACHE_STATS_PATTERN', default='STATS#{}')
+B3LB_CACHE_STATS_TIMEOUT = env.int('B3LB_CACHE_STATS_TIMEOUT', default=300)
 
 B3LB_API_MATE_BASE_URL = env.str('B3LB_API_MATE_BASE_URL', default='https://mconf.github.io/api-mate/')
 B3LB_API_MATE_PW_LENGTH = env.int('B3LB_API_MATE_PW_LENGTH', default=13)
 
+######
+# B3LB Metric Settings
+######
+
+# buffer metric counter increments in redis and flush them periodically into the database
+B3LB_METRIC_BUFFER = env.bool('B3LB_METRIC_BUFFER', default=False)
+B3LB_METRIC_BUFFER_KEY = env.str('B3LB_METRIC_BUFFER_KEY', default='b3lb:metrics')
+B3LB_METRIC_BUFFER_REDIS = env.str('B3LB_METRIC_BUFFER_REDIS', default='redis://redis/3')
+
+# store gauges once per secret (summed over all nodes) instead of per secret and node
+B3LB_METRIC_AGGREGATE_GAUGES = env.bool('B3LB_METRIC_AGGREGATE_GAUGES', default=False)
+
+# operational prometheus instrumentation exported at b3lb/prometheus (base domain only)
+# set PROMETHEUS_MULTIPROC_DIR to aggregate the values of multiple worker processes
+B3LB_PROMETHEUS = env.bool('B3LB_PROMETHEUS', default=False)
+
+######
+# B3LB Load History Settings
+######
+
+# sample node and tenant load, rolled up to 1m and 1h peaks; retention in days
+B3LB_LOAD_HISTORY = env.bool('B3LB_LOAD_HISTORY', default=False)
+B3LB_LOAD_HISTORY_RETENTION_RAW = env.int('B3LB_LOAD_HISTORY_RETENTION_RAW', default=2)
+B3LB_LOAD_HISTORY_RETENTION_MINUTE = env.int('B3LB_LOAD_HISTORY_RETENTION_MINUTE', default=31)
+B3LB_LOAD_HISTORY_RETENTION_HOUR = env.int('B3LB_LOAD_HISTORY_RETENTION_HOUR', default=730)
+
 ######
 # B3LB Storage Setting
 ######
 
 B3LB_RECORD_META_DATA_TAG = env.str("B3LB_RECORD_META_DATA_TAG", default="b3lb-recordset")
 B3LB_RENDERING = env.bool("B3LB_RENDERING", default=False)
+# CPUs used for rendering (0: all), pixels of a profile resolution per render thread
+B3LB_RENDER_THREADS = env.int("B3LB_RENDER_THREADS", default=0)
+B3LB_RENDER_PIXELS_PER_THREAD = env.int("B3LB_RENDER_PIXELS_PER_THREAD", default=518400)
+# share files and assets of identical annotation frames, threads writing annotation files
+B3LB_RENDER_ANNOTATION_DEDUP = env.bool("B3LB_RENDER_ANNOTATION_DEDUP", default=True)
+B3LB_RENDER_ANNOTATION_THREADS = env.int("B3LB_RENDER_ANNOTATION_THREADS", default=4)
+# merge cursor events not moving the cursor by a pixel or not shown in any video frame
+B3LB_RENDER_CURSOR_COMPACTION = env.bool("B3LB_RENDER_CURSOR_COMPACTION", default=True)
+# render scheduler: max. queued or running render jobs (total and per tenant)
+# queued jobs not started within timeout (hours) are rescheduled,
+# running jobs without heartbeat within heartbeat timeout (minutes) count as failed attempt
+B3LB_RENDER_MAX_JOBS = env.int("B3LB_RENDER_MAX_JOBS", default=4)
+B3LB_RENDER_MAX_JOBS_PER_TENANT = env.int("B3LB_RENDER_MAX_JOBS_PER_TENANT", default=1)
+B3LB_RENDER_JOB_TIMEOUT = env.int("B3LB_RENDER_JOB_TIMEOUT", default=12)
+B3LB_RENDER_HEARTBEAT_TIMEOUT = env.int("B3LB_RENDER_HEARTBEAT_TIMEOUT", default=30)
+
+# failed render jobs are retried after a delay (minutes), doubled with every attempt, until max attempts are reached
+B3LB_RENDER_MAX_ATTEMPTS = env.int("B3LB_RENDER_MAX_ATTEMPTS", default=3)
+B3LB_RENDER_RETRY_DELAY = env.int("B3LB_RENDER_RETRY_DELAY", default=15)
 B3LB_RECORD_STORAGE = env.str('B3LB_RECORD_STORAGE', default='local')
 B3LB_S3_ACCESS_KEY = env.str('B3LB_S3_ACCESS_KEY', default=env.str('AWS_S3_ACCESS_KEY_ID', default=env.str('AWS_S3_SECRET_ACCESS_KEY', default='')))
 B3LB_S3_BUCKET_NAME = env.str('B3LB_S3_BUCKET_NAME', 'raw')
@@ -39,6 +90,32 @@ B3LB_S3_ENDPOINT_URL = env.str('B3LB_S3_ENDPOINT_URL', default=env.str('AWS_S3_E
 B3LB_S3_SECRET_KEY = env.str('B3LB_S3_SECRET_KEY', default=env.str('AWS_ACCESS_KEY_ID', default=env.str('AWS_SECRET_ACCESS_KEY', default='')))
 B3LB_S3_URL_PROTOCOL = env.str('B3LB_S3_URL_PROTOCOL', default=env.str('AWS_S3_URL_PROTOCOL', default='https:'))
 
+# resumable recording uploads, staging directory must be shared by all API workers
+# expiry of unfinished uploads in hours
+B3LB_RECORD_UPLOAD_DIR = env.str('B3LB_RECORD_UPLOAD_DIR', default='/tmp/b3lb-upload')
+B3LB_RECORD_UPLOAD_CHUNK_SIZE = env.int('B3LB_RECORD_UPLOAD_CHUNK_SIZE', default=16777216)
+B3LB_RECORD_UPLOAD_EXPIRY = env.int('B3LB_RECORD_UPLOAD_EXPIRY', default=48)
+
+# presigned multipart uploads directly to the S3 bucket (B3LB_RECORD_STORAGE=s3 only)
+# part size in bytes (min. 5 MiB), expiry of presigned part urls in seconds
+B3LB_RECORD_UPLOAD_PRESIGN = env.bool('B3LB_RECORD_UPLOAD_PRESIGN', default=False)
+B3LB_RECORD_UPLOAD_PART_SIZE = env.int('B3LB_RECORD_UPLOAD_PART_SIZE', default=67108864)
+B3LB_RECORD_UPLOAD_PRESIGN_EXPIRY = env.int('B3LB_RECORD_UPLOAD_PRESIGN_EXPIRY', default=3600)
+
+# accepted codecs of recording archives (tar, zstd), advertised to b3lb-push
+B3LB_RECORD_ARCHIVE_CODECS = env.list('B3LB_RECORD_ARCHIVE_CODECS', default=["tar", "zstd"])
+
+# delivery of recording videos: proxy (streamed by b3lb), redirect (to presigned url, s3 storage only)
+# or accel (X-Accel-Redirect to internal nginx location), expiry of presigned urls in seconds
+B3LB_RECORD_DELIVERY = env.str('B3LB_RECORD_DELIVERY', default='proxy')
+B3LB_RECORD_DELIVERY_ACCEL_PREFIX = env.str('B3LB_RECORD_DELIVERY_ACCEL_PREFIX', default='/internal/recordings/')
+B3LB_RECORD_DELIVERY_URL_EXPIRY = env.int('B3LB_RECORD_DELIVERY_URL_EXPIRY', default=300)
+B3LB_RECORD_DELIVERY_CHUNK_SIZE = env.int('B3LB_RECORD_DELIVERY_CHUNK_SIZE', default=262144)
+
+# housekeeping of expired recordings: record sets deleted per batch, parallel S3 DeleteObjects requests
+B3LB_RECORD_DELETE_BATCH_SIZE = env.int('B3LB_RECORD_DELETE_BATCH_SIZE', default=1000)
+B3LB_RECORD_DELETE_THREADS = env.int('B3LB_RECORD_DELETE_THREADS', default=4)
+
 # Filesystem configuration
 # max len is 26
 # HIERARCHY_LEN * HIERARCHY_DEPTH < 26
@@ -164,6 +164,13 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 
+# File uploads (recording archives) are always streamed into temporary files
+# https://docs.djangoproject.com/en/5.2/ref/settings/#file-upload-handlers
+
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+FILE_UPLOAD_TEMP_DIR = env.str('FILE_UPLOAD_TEMP_DIR', default=None)
+
+
 # enable ORM caching for the rest app
 CACHEOPS = {
     # cache all models up to 15s
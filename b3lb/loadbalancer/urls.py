@@ -25,6 +25,7 @@ urlpatterns = [
     path('b3lb/stats', views.stats),
     path('b3lb/metrics', views.metrics),
     path('b3lb/ping', views.ping),
+    path('b3lb/prometheus', views.prometheus),
     re_path(r'^b3lb/b/(?P<backend>[a-z]+)/(?P<endpoint>[a-z]+)$', views.backend_endpoint),
     re_path(r'^b3lb/r/(?P<nonce>[a-zA-Z0-9!@*(_)-]+)$', views.recording),
     re_path(r'^b3lb/t/(?P<slug>[a-z]{2,10})(-(?P<sub_id>\d{3}))?/bbb/api/(?P<endpoint>[0-9.a-zA-Z]*)$', views.bbb_entrypoint),
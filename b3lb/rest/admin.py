@@ -155,6 +155,13 @@ class ClusterGroupRelationAdmin(ModelAdmin):
     list_display = ['cluster_group', 'cluster']
 
 
+class LoadHistoryAdmin(ModelAdmin):
+    model = LoadHistory
+    list_display = ['timestamp', 'resolution', 'node', 'tenant', 'attendees', 'meetings', 'cpu_load']
+    list_filter = ['resolution', ('node', RelatedOnlyFieldListFilter), ('tenant', RelatedOnlyFieldListFilter)]
+    date_hierarchy = 'timestamp'
+
+
 class MeetingAdmin(ModelAdmin):
     model = Meeting
     list_display = ['__str__', 'bbb_origin_server_name', 'node', 'attendees', 'listenerCount', 'voiceParticipantCount', 'videoCount', 'age', 'id']
@@ -233,14 +240,14 @@ class RecordAdmin(ModelAdmin):
 
 class RecordProfileAdmin(ModelAdmin):
     model = RecordProfile
-    list_display = ['name', 'description', 'width', 'height', 'webcam_size', 'annotations', 'is_default']
+    list_display = ['name', 'description', 'width', 'height', 'webcam_size', 'annotations', 'video_codec', 'encoder_preset', 'is_default']
 
 
 class RecordSetAdmin(ModelAdmin):
     model = RecordSet
-    list_display = ['__str__', 'secret', 'status', 'meta_meeting_id', 'created_at']
+    list_display = ['__str__', 'secret', 'status', 'render_priority', 'meta_meeting_id', 'created_at']
     list_filter = [('secret__tenant', RelatedOnlyFieldListFilter), 'status', 'created_at']
-    actions = ["set_to_deletion", "set_to_rerender"]
+    actions = ["set_to_deletion", "set_to_rerender", "set_render_priority"]
 
     class Meta(object):
         ordering = ['secret', 'created_at']
@@ -257,7 +264,13 @@ class RecordSetAdmin(ModelAdmin):
 
     @action(permissions=["view"], description="Set status for re-rendering")
     def set_to_rerender(self, request, queryset):
-        queryset.update(status=RecordSet.UPLOADED)
+        queryset.update(status=RecordSet.UPLOADED, render_attempts=0, render_failed_at=None)
+
+    @action(permissions=["view"], description="Render on demand (prioritize)")
+    def set_render_priority(self, request, queryset):
+        queryset.update(render_priority=RecordSet.PRIORITY_ON_DEMAND)
+        # failed RecordSets are retried immediately
+        queryset.filter(status__in=[RecordSet.UPLOADED, RecordSet.FAILED]).update(status=RecordSet.UPLOADED, render_attempts=0, render_failed_at=None)
 
 
 class SecretAdmin(ModelAdmin):
@@ -313,11 +326,6 @@ class SecretMeetingListAdmin(ModelAdmin):
     list_display = ['secret']
 
 
-class SecretMetricsListAdmin(ModelAdmin):
-    model = SecretMetricsList
-    list_display = ['__str__']
-
-
 class SecretRecordProfileRelationAdmin(ModelAdmin):
     model = SecretRecordProfileRelation
     list_display = ['__str__', 'secret', 'record_profile']
@@ -352,6 +360,7 @@ site.register(Asset, AssetAdmin)
 site.register(Cluster, ClusterAdmin)
 site.register(ClusterGroup, ClusterGroupAdmin)
 site.register(ClusterGroupRelation, ClusterGroupRelationAdmin)
+site.register(LoadHistory, LoadHistoryAdmin)
 site.register(Meeting, MeetingAdmin)
 site.register(Metric, MetricAdmin)
 site.register(Node, NodeAdmin)
@@ -362,7 +371,6 @@ site.register(RecordProfile, RecordProfileAdmin)
 site.register(RecordSet, RecordSetAdmin)
 site.register(Secret, SecretAdmin)
 site.register(SecretMeetingList, SecretMeetingListAdmin)
-site.register(SecretMetricsList, SecretMetricsListAdmin)
 site.register(SecretRecordProfileRelation, SecretRecordProfileRelationAdmin)
 site.register(Stats, StatsAdmin)
 site.register(Tenant, TenantAdmin)
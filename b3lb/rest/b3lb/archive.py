@@ -0,0 +1,52 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import BinaryIO, List
+
+
+TAR = "tar"
+ZSTD = "zstd"
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+ARCHIVE_NAMES = {
+    TAR: "raw.tar",
+    ZSTD: "raw.tar.zst",
+}
+
+EXTRACT_ARGS = {
+    TAR: ["tar", "-xf"],
+    ZSTD: ["tar", "--zstd", "-xf"],
+}
+
+
+def get_archive_codec(fh: BinaryIO) -> str:
+    """
+    Detect codec of a recording archive by its magic bytes, uncompressed tar otherwise.
+    The file position is restored.
+    """
+    position = fh.tell()
+    magic = fh.read(len(ZSTD_MAGIC))
+    fh.seek(position)
+    if magic == ZSTD_MAGIC:
+        return ZSTD
+    return TAR
+
+
+def get_extract_args(archive_path: str) -> List[str]:
+    with open(archive_path, "rb") as fh:
+        return EXTRACT_ARGS[get_archive_codec(fh)] + [archive_path]
@@ -0,0 +1,137 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from rest.b3lb.upload import get_storage_key
+from rest.b3lb.utils import aiter_file_chunks, iter_file_chunks, parse_range_header
+from rest.models import Record
+from storages.backends.s3 import S3Storage
+from typing import BinaryIO
+from urllib.parse import quote
+
+# delivery modes of recording videos
+PROXY = "proxy"
+REDIRECT = "redirect"
+ACCEL = "accel"
+
+
+def get_record_etag(record: Record, size: int) -> str:
+    # re-rendering replaces the file of a Record and updates uploaded_at
+    return quote_etag(f"{record.uuid.hex}-{size:x}-{round(record.uploaded_at.timestamp() * 1000000):x}")
+
+
+def is_range_applicable(request: HttpRequest, etag: str, last_modified: int) -> bool:
+    """
+    If-Range: use Range header only if the client's copy is still the current one.
+    """
+    if_range = request.headers.get("If-Range", "")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def open_record_range(record: Record, first: int, last: int) -> BinaryIO:
+    """
+    Open byte range of record file, S3 objects are streamed by a ranged GET instead of being downloaded completely.
+    """
+    storage = record.file.storage
+    if isinstance(storage, S3Storage):
+        key = get_storage_key(storage, record.file.name)
+        return storage.connection.meta.client.get_object(Bucket=storage.bucket_name, Key=key, Range=f"bytes={first}-{last}")["Body"]
+    fh = record.file.open("rb")
+    fh.seek(first)
+    return fh
+
+
+def get_redirect_response(record: Record, filename: str) -> HttpResponse:
+    storage = record.file.storage
+    url = storage.connection.meta.client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": storage.bucket_name,
+            "Key": get_storage_key(storage, record.file.name),
+            "ResponseContentDisposition": content_disposition_header(True, filename),
+            "ResponseContentType": record.profile.mime_type,
+        },
+        ExpiresIn=settings.B3LB_RECORD_DELIVERY_URL_EXPIRY,
+    )
+    return HttpResponseRedirect(url)
+
+
+def get_accel_response(record: Record, filename: str) -> HttpResponse:
+    # nginx serves the file (including ranges) from its internal location
+    response = HttpResponse(content_type=record.profile.mime_type)
+    response["X-Accel-Redirect"] = f"{settings.B3LB_RECORD_DELIVERY_ACCEL_PREFIX}{quote(record.file.name)}"
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
+
+
+def get_proxy_response(request: HttpRequest, record: Record, filename: str) -> HttpResponse:
+    """
+    Stream record file with support of conditional requests (ETag, Last-Modified) and single byte ranges.
+    """
+    size = record.get_file_size()
+    if not size:
+        return HttpResponseNotFound()
+
+    etag = get_record_etag(record, size)
+    last_modified = int(record.uploaded_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = None
+        if is_range_applicable(request, etag, last_modified):
+            byte_range = parse_range_header(request.headers.get("Range", ""), size)
+
+        if byte_range and byte_range[0] >= size:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        else:
+            first, last = byte_range or (0, size - 1)
+            length = last - first + 1
+            status = 206 if byte_range else 200
+            if request.method == "HEAD":
+                # headers only, the file is not opened
+                response = HttpResponse(status=status, content_type=record.profile.mime_type)
+            else:
+                # ASGI servers need an async iterator, sync iterators would be read completely before sending
+                iter_chunks = aiter_file_chunks if isinstance(request, ASGIRequest) else iter_file_chunks
+                chunks = iter_chunks(open_record_range(record, first, last), length, settings.B3LB_RECORD_DELIVERY_CHUNK_SIZE)
+                response = StreamingHttpResponse(chunks, status=status, content_type=record.profile.mime_type)
+            response["Content-Length"] = str(length)
+            response["Content-Disposition"] = content_disposition_header(True, filename)
+            if byte_range:
+                response["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def get_record_response(request: HttpRequest, record: Record) -> HttpResponse:
+    filename = f"video.{record.profile.file_extension}"
+    if settings.B3LB_RECORD_DELIVERY == REDIRECT and isinstance(record.file.storage, S3Storage):
+        return get_redirect_response(record, filename)
+    if settings.B3LB_RECORD_DELIVERY == ACCEL:
+        return get_accel_response(record, filename)
+    return get_proxy_response(request, record, filename)
@@ -0,0 +1,114 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Any, Dict, List
+
+# ges-launch encoding format: container, video and audio caps by mime type and codec
+MP4 = "video/mp4"
+WEBM = "video/webm"
+
+H264 = "h264"
+VP9 = "vp9"
+AV1 = "av1"
+
+CONTAINER_CAPS = {
+    MP4: "video/quicktime,variant=iso",
+    WEBM: "video/webm",
+}
+
+AUDIO_CAPS = {
+    MP4: "audio/mpeg,mpegversion=4,base-profile=lc",
+    WEBM: "audio/x-opus",
+}
+
+VIDEO_CAPS = {
+    H264: "video/x-h264",
+    VP9: "video/x-vp9",
+    AV1: "video/x-av1",
+}
+
+CONTAINER_CODECS = {
+    MP4: [H264, AV1],
+    WEBM: [VP9, AV1],
+}
+
+FASTEST = "fastest"
+FAST = "fast"
+BALANCED = "balanced"
+QUALITY = "quality"
+PRESETS = [FASTEST, FAST, BALANCED, QUALITY]
+
+# encoder properties by preset (fastest, fast, balanced, quality)
+PRESET_PROPERTIES = {
+    "x264enc": [{"speed-preset": "ultrafast"}, {"speed-preset": "veryfast"}, {"speed-preset": "medium"}, {"speed-preset": "slow"}],
+    "vp9enc": [{"deadline": 1, "cpu-used": 8}, {"deadline": 1000000, "cpu-used": 5}, {"deadline": 1000000, "cpu-used": 3}, {"deadline": 1000000, "cpu-used": 1}],
+    "av1enc": [{"cpu-used": 8}, {"cpu-used": 6}, {"cpu-used": 4}, {"cpu-used": 2}],
+    "svtav1enc": [{"preset": 12}, {"preset": 10}, {"preset": 8}, {"preset": 5}],
+}
+
+# encoder property names of bitrate (with factor from kbit/s), threads and keyframe interval
+ENCODER_PROPERTIES = {
+    H264: {"x264enc": {"bitrate": ("bitrate", 1), "threads": "threads", "keyframe": "key-int-max"}},
+    VP9: {"vp9enc": {"bitrate": ("target-bitrate", 1000), "threads": "threads", "keyframe": "keyframe-max-dist"}},
+    AV1: {
+        "av1enc": {"bitrate": ("target-bitrate", 1), "threads": "threads", "keyframe": "keyframe-max-dist"},
+        "svtav1enc": {"bitrate": ("target-bitrate", 1), "keyframe": "intra-period-length"},
+    },
+}
+
+
+def get_video_codec(mime_type: str, video_codec: str) -> str:
+    """
+    Codec of video stream, falls back to the default codec of the container.
+    """
+    codecs = CONTAINER_CODECS.get(mime_type, CONTAINER_CODECS[MP4])
+    if video_codec in codecs:
+        return video_codec
+    return codecs[0]
+
+
+def get_encoder_properties(record_profile, threads: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    Properties of all encoder elements, which may be used for the codec of the profile.
+    """
+    encoders = {}
+    preset = PRESETS.index(record_profile.encoder_preset) if record_profile.encoder_preset in PRESETS else PRESETS.index(BALANCED)
+    threads = record_profile.encoder_threads or threads
+    for factory, names in ENCODER_PROPERTIES[get_video_codec(record_profile.mime_type, record_profile.video_codec)].items():
+        properties = dict(PRESET_PROPERTIES[factory][preset])
+        if record_profile.video_bitrate > 0:
+            name, factor = names["bitrate"]
+            properties[name] = record_profile.video_bitrate * factor
+        if threads > 0 and "threads" in names:
+            properties[names["threads"]] = threads
+        if record_profile.keyframe_interval > 0:
+            properties[names["keyframe"]] = record_profile.keyframe_interval
+        encoders[factory] = properties
+    return encoders
+
+
+def get_encoding_format(record_profile, threads: int = 0) -> str:
+    """
+    Encoding profile of ges-launch (--format) with encoder properties of the profile, e.g.
+    video/webm:video/x-vp9(element-properties-map, map={[vp9enc,deadline=1,cpu-used=8]}):audio/x-opus
+    """
+    codec = get_video_codec(record_profile.mime_type, record_profile.video_codec)
+    container = record_profile.mime_type if record_profile.mime_type in CONTAINER_CAPS else MP4
+    elements: List[str] = []
+    for factory, properties in get_encoder_properties(record_profile, threads).items():
+        elements.append("[{}]".format(",".join([factory] + [f"{name}={value}" for name, value in properties.items()])))
+    return f"{CONTAINER_CAPS[container]}:{VIDEO_CAPS[codec]}(element-properties-map, map={{{','.join(elements)}}}):{AUDIO_CAPS[container]}"
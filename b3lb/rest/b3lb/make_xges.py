@@ -11,27 +11,35 @@ gi.require_version('GstPbutils', '1.0')
 gi.require_version('GES', '1.0')
 from gi.repository import GLib, GObject, Gst, GstPbutils, GES
 
-from operator import add as operator_add
-from collections import namedtuple
+from django.conf import settings
 from intervaltree import IntervalTree
-from os.path import join, realpath
+from os.path import dirname, join, realpath
 from xml.etree import ElementTree
+from rest.b3lb.probe import MediaInfo, ProbeCache
+from rest.b3lb.timeline import get_annotation_frames, get_cursor_clips, get_cursor_events, get_slides, write_annotation_files
 from rest.models import RecordProfile
-from typing import List
-
-# GStreamer's content detection doesn't work well with ElementTree's
-# automatically assigned namespace prefixes.
-ElementTree.register_namespace("", "http://www.w3.org/2000/svg")
-
-
-SlideInfo = namedtuple('SlideInfo', ['id', 'width', 'height', 'start', 'end'])
-CursorEvent = namedtuple('CursorEvent', ['x', 'y', 'start'])
+from typing import Dict, List
 
 
 def file_to_uri(path):
     path = realpath(path)
     return 'file://' + path
 
+def get_media_info(asset) -> MediaInfo:
+    info = asset.get_info()
+    video_streams = info.get_video_streams()
+    audio_streams = info.get_audio_streams()
+    return MediaInfo(
+        width=video_streams[0].get_width() if video_streams else 0,
+        height=video_streams[0].get_height() if video_streams else 0,
+        duration=asset.props.duration,
+        is_image=asset.is_image(),
+        framerate_num=video_streams[0].get_framerate_num() if video_streams else 0,
+        framerate_denom=video_streams[0].get_framerate_denom() if video_streams else 1,
+        rate=audio_streams[0].get_sample_rate() if audio_streams else 0,
+        channels=audio_streams[0].get_channels() if audio_streams else 0,
+    )
+
 class OPTS:
     start: int  # seconds, no in use by b3lb
     end: None  # seconds or None, not in use by b3lb
@@ -44,10 +52,15 @@ class OPTS:
     opening_credits: List[str] = []  # list of file paths, not in use by b3lb
     closing_credits: List[str] = []  # list of file paths, not in use by b3lb
     annotations: bool = False
+    annotation_dedup: bool = False
+    annotation_threads: int = 1
+    cursor_compaction: bool = False
+    encoding_format: str = ""
     basedir: str = ""
+    workdir: str = ""
     project: str = ""
 
-    def __init__(self, in_dir: str, out_dir: str, record_profile: RecordProfile):
+    def __init__(self, in_dir: str, out_dir: str, record_profile: RecordProfile, encoding_format: str):
         self.start = 0
         self.end = None
         self.width = record_profile.width
@@ -59,11 +72,16 @@ class OPTS:
         self.opening_credits = []
         self.closing_credits = []
         self.annotations = record_profile.annotations
+        self.annotation_dedup = settings.B3LB_RENDER_ANNOTATION_DEDUP
+        self.annotation_threads = settings.B3LB_RENDER_ANNOTATION_THREADS
+        self.cursor_compaction = settings.B3LB_RENDER_CURSOR_COMPACTION
+        self.encoding_format = encoding_format
         self.basedir = in_dir
+        self.workdir = dirname(out_dir)
         self.project = out_dir
 
 class Presentation:
-    def __init__(self, opts: OPTS):
+    def __init__(self, opts: OPTS, assets: Dict[str, GES.UriClipAsset]):
         self.opts = opts
         self.cam_width = round(opts.width * opts.webcam_size / 100)
         self.slides_width = opts.width - self.cam_width
@@ -75,10 +93,13 @@ class Presentation:
         if self.video_track.type == GES.TrackType.AUDIO:
             self.video_track, self.audio_track = self.audio_track, self.video_track
         self.project = self.timeline.get_asset()
-        self._assets = {}
+        self._assets = assets
+        self._project_assets = set()
+        self._probe = ProbeCache(opts.basedir)
 
         self.start_time = round(self.opts.start * Gst.SECOND)
         self.end_time = 0
+        self.frame_duration = 0
 
         # Offset for the opening credits
         self.opening_length = 0
@@ -96,18 +117,26 @@ class Presentation:
         return layer
 
     def _get_asset(self, path):
+        # assets are shared by all profiles of the RecordSet, so files are discovered once per render job
         asset = self._assets.get(path)
         if asset is None:
             asset = GES.UriClipAsset.request_sync(file_to_uri(path))
-            self.project.add_asset(asset)
             self._assets[path] = asset
+        if path not in self._project_assets:
+            self.project.add_asset(asset)
+            self._project_assets.add(path)
         return asset
 
-    @staticmethod
-    def _get_dimensions(asset):
-        info = asset.get_info()
-        video_info = info.get_video_streams()[0]
-        return video_info.get_width(), video_info.get_height()
+    def _get_media_info(self, path) -> MediaInfo:
+        # discover file only if not in probe cache of the extracted archive
+        info = self._probe.get(path)
+        if info is None:
+            info = self._probe.set(path, get_media_info(self._get_asset(path)))
+        return info
+
+    def _get_dimensions(self, path):
+        info = self._get_media_info(path)
+        return info.width, info.height
 
     @staticmethod
     def _constrain(dimensions, bounds):
@@ -118,7 +147,7 @@ class Presentation:
             return max_width, new_height
         return round(width * max_height / height), max_height
 
-    def _add_clip(self, layer, asset, start, inpoint, duration, posx, posy, width, height, trim_end=True):
+    def _add_clip(self, layer, path, start, inpoint, duration, posx, posy, width, height, trim_end=True):
         if trim_end:
             # Skip clips entirely after the end point
             if start > self.end_time:
@@ -133,14 +162,15 @@ class Presentation:
         start -= self.start_time
         if start < 0:
             duration += start
-            if not asset.is_image():
+            if not self._get_media_info(path).is_image:
                 inpoint += -start
             start = 0
 
         # Offset start point by the length of the opening credits
         start += self.opening_length
 
-        clip = layer.add_asset(asset, start, inpoint, duration,
+        # assets of skipped clips are never requested
+        clip = layer.add_asset(self._get_asset(path), start, inpoint, duration,
                                GES.TrackType.UNKNOWN)
         for element in clip.find_track_elements(
                 self.video_track, GES.TrackType.VIDEO, GObject.TYPE_NONE):
@@ -152,32 +182,36 @@ class Presentation:
 
     def set_track_caps(self):
         # Set frame rate and audio rate based on webcam capture
-        asset = self._get_asset(join(self.opts.basedir, 'video/webcams.webm'))
-        info = asset.get_info()
+        info = self._get_media_info(join(self.opts.basedir, 'video/webcams.webm'))
 
-        video_info = info.get_video_streams()[0]
+        if info.framerate_num:
+            self.frame_duration = round(Gst.SECOND * info.framerate_denom / info.framerate_num)
         self.video_track.props.restriction_caps = Gst.Caps.from_string(
             'video/x-raw(ANY), width=(int){}, height=(int){}, '
             'framerate=(fraction){}/{}'.format(
                 self.opts.width, self.opts.height,
-                video_info.get_framerate_num(),
-                video_info.get_framerate_denom()))
+                info.framerate_num,
+                info.framerate_denom))
 
-        audio_info = info.get_audio_streams()[0]
         self.audio_track.props.restriction_caps = Gst.Caps.from_string(
             'audio/x-raw(ANY), rate=(int){}, channels=(int){}'.format(
-                audio_info.get_sample_rate(), audio_info.get_channels()))
+                info.rate, info.channels))
 
         # Set start and end time from options
         if not self.opts.end:
-            self.end_time = asset.props.duration
+            self.end_time = info.duration
         else:
             self.end_time = round(self.opts.end * Gst.SECOND)
 
         # Add an encoding profile for the benefit of Pitivi
-        profile = GstPbutils.EncodingContainerProfile.new('MP4', 'bbb-render encoding profile', Gst.Caps.from_string('video/quicktime,variant=iso'))
-        profile.add_profile(GstPbutils.EncodingVideoProfile.new(Gst.Caps.from_string('video/x-h264,profile=high'), None, self.video_track.props.restriction_caps, 0))
-        profile.add_profile(GstPbutils.EncodingAudioProfile.new(Gst.Caps.from_string('audio/mpeg,mpegversion=4,base-profile=lc'), None, self.audio_track.props.restriction_caps, 0))
+        # container, codecs and encoder properties of the record profile
+        profile = GstPbutils.EncodingProfile.from_string(self.opts.encoding_format)
+        profile.set_name('bbb-render')
+        for sub_profile in profile.get_profiles():
+            if isinstance(sub_profile, GstPbutils.EncodingVideoProfile):
+                sub_profile.set_restriction(self.video_track.props.restriction_caps)
+            elif isinstance(sub_profile, GstPbutils.EncodingAudioProfile):
+                sub_profile.set_restriction(self.audio_track.props.restriction_caps)
         self.project.add_encoding_profile(profile)
 
     def set_project_metadata(self):
@@ -189,12 +223,12 @@ class Presentation:
 
     def add_webcams(self):
         layer = self._add_layer('Camera')
-        asset = self._get_asset(join(self.opts.basedir, 'video/webcams.webm'))
-        dims = self._get_dimensions(asset)
+        path = join(self.opts.basedir, 'video/webcams.webm')
+        dims = self._get_dimensions(path)
         if self.opts.stretch_webcam or self.opts.crop_webcam:
             dims = (dims[0] * 16/12, dims[1])
         width, height = self._constrain(dims, (self.cam_width, self.opts.height))
-        clip = self._add_clip(layer, asset, 0, 0, asset.props.duration, self.opts.width - width, 0, width, height)
+        clip = self._add_clip(layer, path, 0, 0, self._get_media_info(path).duration, self.opts.width - width, 0, width, height)
 
         if self.opts.crop_webcam:
             effect = GES.Effect.new('aspectratiocrop aspect-ratio=16/9')
@@ -203,17 +237,10 @@ class Presentation:
     def add_slides(self):
         layer = self._add_layer('Slides')
         doc = ElementTree.parse(join(self.opts.basedir, 'shapes.svg'))
-        slides = {}
+        slides = get_slides(doc)
         slide_time = IntervalTree()
         for img in doc.iterfind('./{http://www.w3.org/2000/svg}image[@class="slide"]'):
-            info = SlideInfo(
-                id=img.get('id'),
-                width=int(img.get('width')),
-                height=int(img.get('height')),
-                start=round(float(img.get('in')) * Gst.SECOND),
-                end=round(float(img.get('out')) * Gst.SECOND),
-            )
-            slides[info.id] = info
+            info = slides[img.get('id')]
             slide_time.addi(info.start, info.end, info)
 
             # Don't bother creating an asset for out of range slides
@@ -225,9 +252,9 @@ class Presentation:
             if path.endswith('/deskshare.png'):
                 continue
 
-            asset = self._get_asset(join(self.opts.basedir, path))
-            width, height = self._constrain(self._get_dimensions(asset), (self.slides_width, self.opts.height))
-            self._add_clip(layer, asset, info.start, 0, info.end - info.start, 0, 0, width, height)
+            path = join(self.opts.basedir, path)
+            width, height = self._constrain(self._get_dimensions(path), (self.slides_width, self.opts.height))
+            self._add_clip(layer, path, info.start, 0, info.end - info.start, 0, 0, width, height)
 
         # If we're not processing annotations, then we're done.
         if not self.opts.annotations:
@@ -236,90 +263,29 @@ class Presentation:
         cursor_layer = self._add_layer('Cursor')
         # Move above the slides layer
         self.timeline.move_layer(cursor_layer, cursor_layer.get_priority() - 1)
-        dot = self._get_asset('rest/b3lb/dot.png')
+        dot = 'rest/b3lb/dot.png'
         dot_width, dot_height = self._get_dimensions(dot)
         cursor_doc = ElementTree.parse(join(self.opts.basedir, 'cursor.xml'))
-        events = []
-        for event in cursor_doc.iterfind('./event'):
-            x, y = event.find('./cursor').text.split()
-            start = round(float(event.attrib['timestamp']) * Gst.SECOND)
-            events.append(CursorEvent(float(x), float(y), start))
-
-        for i, pos in enumerate(events):
-            # negative positions are used to indicate that no cursor
-            # should be displayed.
-            if pos.x < 0 and pos.y < 0:
-                continue
-
-            # Show cursor until next event or if it is the last event,
-            # the end of recording.
-            if i + 1 < len(events):
-                end = events[i + 1].start
-            else:
-                end = self.end_time
-
-            # Find the width/height of the slide corresponding to this
-            # point in time
-            info_list = [i.data for i in slide_time.at(pos.start)]
-            if info_list:
-                info = info_list[0]
-                width, height = self._constrain(
-                    (info.width, info.height),
-                    (self.slides_width, self.opts.height))
+        events = get_cursor_events(cursor_doc)
 
-                self._add_clip(cursor_layer, dot, pos.start, 0, end - pos.start, round(width*pos.x - dot_width/2), round(height*pos.y - dot_height / 2), dot_width, dot_height)
+        # compaction drops cursor events, which don't move the dot or aren't shown in any video frame
+        clips = get_cursor_clips(
+            events, slide_time,
+            lambda info: self._constrain((info.width, info.height), (self.slides_width, self.opts.height)),
+            (dot_width, dot_height), self.end_time, self.opts.cursor_compaction, self.frame_duration)
+        for clip in clips:
+            self._add_clip(cursor_layer, dot, clip.start, 0, clip.end - clip.start, clip.x, clip.y, dot_width, dot_height)
 
         layer = self._add_layer('Annotations')
         # Move above the slides layer
         self.timeline.move_layer(layer, layer.get_priority() - 1)
 
-        for canvas in doc.iterfind('./{http://www.w3.org/2000/svg}g[@class="canvas"]'):
-            info = slides[canvas.get('image')]
-            t = IntervalTree()
-            for index, shape in enumerate(canvas.iterfind('./{http://www.w3.org/2000/svg}g[@class="shape"]')):
-                shape.set('style', shape.get('style').replace(
-                    'visibility:hidden;', ''))
-                timestamp = round(float(shape.get('timestamp')) * Gst.SECOND)
-                undo = round(float(shape.get('undo')) * Gst.SECOND)
-                if undo < 0:
-                    undo = info.end
-
-                # Clip timestamps to slide visibility
-                start = min(max(timestamp, info.start), info.end)
-                end = min(max(undo, info.start), info.end)
-
-                # Don't bother creating annotations for out of range times
-                if end < self.start_time or start > self.end_time:
-                    continue
-
-                t.addi(start, end, [(index, shape)])
-
-            t.split_overlaps()
-            t.merge_overlaps(strict=True, data_reducer=operator_add)
-            for interval_index, interval in enumerate(sorted(t)):
-                svg = ElementTree.Element('{http://www.w3.org/2000/svg}svg')
-                svg.set('version', '1.1')
-                svg.set('width', '{}px'.format(info.width))
-                svg.set('height', '{}px'.format(info.height))
-                svg.set('viewBox', '0 0 {} {}'.format(info.width, info.height))
-
-                # We want to discard all but the last version of each
-                # shape ID, which requires two passes.
-                shapes = sorted(interval.data)
-                shape_index = {}
-                for index, shape in shapes:
-                    shape_index[shape.get('shape')] = index
-                for index, shape in shapes:
-                    if shape_index[shape.get('shape')] != index: continue
-                    svg.append(shape)
-
-                path = join(self.opts.basedir, 'annotations-{}-{}.svg'.format(info.id, interval_index))
-                with open(path, 'wb') as fp:
-                    fp.write(ElementTree.tostring(svg, xml_declaration=True))
-
-                asset = self._get_asset(path)
-                width, height = self._constrain((info.width, info.height), (self.slides_width, self.opts.height))
-                self._add_clip(layer, asset, interval.begin, 0, interval.end - interval.begin, 0, 0, width, height)
+        # identical annotation frames share one file and asset in dedup mode
+        frames = get_annotation_frames(doc, slides, self.start_time, self.end_time, self.opts.annotation_dedup)
+        write_annotation_files(frames, self.opts.workdir, self.opts.annotation_threads)
+        for frame in frames:
+            width, height = self._constrain((frame.info.width, frame.info.height), (self.slides_width, self.opts.height))
+            self._add_clip(layer, join(self.opts.workdir, frame.name), frame.start, 0, frame.end - frame.start, 0, 0, width, height)
 
     def add_deskshare(self):
         doc = ElementTree.parse(join(self.opts.basedir, 'deskshare.xml'))
@@ -328,9 +294,9 @@ class Presentation:
             return
 
         layer = self._add_layer('Deskshare')
-        asset = self._get_asset(join(self.opts.basedir, 'deskshare/deskshare.webm'))
-        width, height = self._constrain(self._get_dimensions(asset), (self.slides_width, self.opts.height))
-        duration = asset.props.duration
+        path = join(self.opts.basedir, 'deskshare/deskshare.webm')
+        width, height = self._constrain(self._get_dimensions(path), (self.slides_width, self.opts.height))
+        duration = self._get_media_info(path).duration
         for event in events:
             start = round(float(event.get('start_timestamp')) * Gst.SECOND)
             end = round(float(event.get('stop_timestamp')) * Gst.SECOND)
@@ -338,16 +304,21 @@ class Presentation:
             if start > duration:
                 continue
             end = min(end, duration)
-            self._add_clip(layer, asset, start, start, end - start, 0, 0, width, height)
+            self._add_clip(layer, path, start, start, end - start, 0, 0, width, height)
 
     def save(self):
         self.timeline.commit_sync()
         self.timeline.save_to_uri(file_to_uri(self.opts.project), None, True)
+        self._probe.save()
 
 
-def render_xges(in_dir: str, out_dir: str, record_profile: RecordProfile):
-    opts = OPTS(in_dir, out_dir, record_profile)
+def render_xges(in_dir: str, out_dir: str, record_profile: RecordProfile, encoding_format: str, assets: Dict[str, GES.UriClipAsset]):
+    """
+    Generate xges project of record_profile with the encoding format used by ges-launch,
+    assets are shared with the other profiles of the RecordSet.
+    """
+    opts = OPTS(in_dir, out_dir, record_profile, encoding_format)
     Gst.init(None)
     GES.init()
-    p = Presentation(opts)
+    p = Presentation(opts, assets)
     p.save()
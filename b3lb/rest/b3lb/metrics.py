@@ -14,23 +14,97 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from rest.models import Metric, Node, Secret
-from django.db.models import F
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from redis import Redis
+from redis.exceptions import RedisError, ResponseError
+from rest.models import Meeting, Metric, MetricFlush, Node, Secret
+from typing import Dict, List, Union
+from uuid import uuid4
 
 
 METRIC_BIGINT_MODULO = 9223372036854775808
 
+metric_buffer: Union[Redis, None] = None
+
+
+def get_metric_buffer() -> Redis:
+    global metric_buffer
+    if metric_buffer is None:
+        metric_buffer = Redis.from_url(settings.B3LB_METRIC_BUFFER_REDIS)
+    return metric_buffer
+
+
 def del_metric(name, secret, node):
     Metric.objects.filter(name=name, secret=secret, node=node).delete()
 
 
-def incr_metric(name: str, secret: Secret, node: Node, incr: int = 1):
-    if Metric.objects.filter(name=name, secret=secret, node=node).update(value=(F("value") + incr) % METRIC_BIGINT_MODULO) == 0:
-        metric, created = Metric.objects.get_or_create(name=name, secret=secret, node=node)
+def add_metric(name: str, secret_id, node_id, incr: int = 1):
+    if Metric.objects.filter(name=name, secret_id=secret_id, node_id=node_id).update(value=(F("value") + incr) % METRIC_BIGINT_MODULO) == 0:
+        metric, created = Metric.objects.get_or_create(name=name, secret_id=secret_id, node_id=node_id)
         metric.value = (F("value") + incr) % METRIC_BIGINT_MODULO
         metric.save(update_fields=["value"])
 
 
+def incr_metric(name: str, secret: Secret, node: Node, incr: int = 1):
+    node_id = node.uuid if node else None
+    if settings.B3LB_METRIC_BUFFER:
+        try:
+            get_metric_buffer().hincrby(settings.B3LB_METRIC_BUFFER_KEY, f"{name}|{secret.uuid}|{node_id or ''}", incr)
+            return
+        except RedisError:
+            pass  # buffer not reachable, fall back to direct database update
+    add_metric(name, secret.uuid, node_id, incr)
+
+
+def flush_metric_buffer() -> int:
+    """
+    Move buffered metric increments into the database.
+    The buffer hash is renamed atomically, so increments arriving during the flush go to a new hash.
+    Each flush gets an id committed together with the deltas, so a flush interrupted after the commit is not applied twice.
+    Returns the number of flushed (name, secret, node) deltas.
+    """
+    buffer = get_metric_buffer()
+    flush_key = f"{settings.B3LB_METRIC_BUFFER_KEY}:flush"
+    flush_id_key = f"{flush_key}:id"
+
+    # deltas of an interrupted flush are left in flush_key and will be flushed first
+    if not buffer.exists(flush_key):
+        try:
+            buffer.rename(settings.B3LB_METRIC_BUFFER_KEY, flush_key)
+        except ResponseError:
+            return 0  # no buffered increments
+
+    # keep the id of an interrupted flush
+    buffer.set(flush_id_key, uuid4().hex, nx=True)
+    flush_id = buffer.get(flush_id_key).decode()
+
+    deltas = []
+    for field, incr in buffer.hgetall(flush_key).items():
+        name, secret_id, node_id = field.decode().split("|")
+        deltas.append((name, secret_id, node_id or None, int(incr)))
+
+    # skip deltas of secrets or nodes deleted in the meantime
+    secret_ids = {str(uuid) for uuid in Secret.objects.filter(uuid__in={delta[1] for delta in deltas}).values_list("uuid", flat=True)}
+    node_ids = {str(uuid) for uuid in Node.objects.filter(uuid__in={delta[2] for delta in deltas if delta[2]}).values_list("uuid", flat=True)}
+
+    with transaction.atomic():
+        # deltas have already been committed by an interrupted flush
+        if MetricFlush.objects.filter(id=flush_id).exists():
+            deltas = []
+        else:
+            MetricFlush.objects.create(id=flush_id)
+        for name, secret_id, node_id, incr in deltas:
+            if secret_id in secret_ids and (node_id is None or node_id in node_ids):
+                add_metric(name, secret_id, node_id, incr)
+    buffer.delete(flush_key, flush_id_key)
+    MetricFlush.objects.filter(flushed_at__lt=timezone.now() - timedelta(days=1)).delete()
+    return len(deltas)
+
+
 def set_metric(name, secret, node, value):
     if Metric.objects.filter(name=name, secret=secret, node=node).update(value=value) == 0:
         metric, created = Metric.objects.get_or_create(name=name, secret=secret, node=node)
@@ -38,6 +112,37 @@ def set_metric(name, secret, node, value):
         metric.save(update_fields=["value"])
 
 
+def set_gauge_metrics() -> int:
+    """
+    Store gauges summed over all nodes once per secret (node is None).
+    Aggregated by a single GROUP BY query on running meetings, zero gauges are not stored.
+    Returns the number of stored gauges.
+    """
+    aggregates = {
+        Metric.ATTENDEES: Sum("attendees"),
+        Metric.LISTENERS: Sum("listenerCount"),
+        Metric.VOICES: Sum("voiceParticipantCount"),
+        Metric.VIDEOS: Sum("videoCount"),
+        Metric.MEETINGS: Count("uuid"),
+    }
+    gauges = {}
+    for row in Meeting.objects.filter(node__has_errors=False).values("secret").annotate(**{f"gauge_{name}": aggregate for name, aggregate in aggregates.items()}).order_by():
+        for name in aggregates:
+            if row[f"gauge_{name}"]:
+                gauges[(name, row["secret"])] = row[f"gauge_{name}"]
+
+    existing = {(name, secret_id): (metric_id, value) for metric_id, name, secret_id, value in Metric.objects.filter(name__in=Metric.GAUGES, node=None).values_list("id", "name", "secret_id", "value")}
+    with transaction.atomic():
+        # per node gauges are left over from non-aggregated mode
+        Metric.objects.filter(name__in=Metric.GAUGES, node__isnull=False).delete()
+        Metric.objects.filter(id__in=[existing[key][0] for key in existing.keys() - gauges.keys()]).delete()
+        for key in gauges.keys() & existing.keys():
+            if existing[key][1] != gauges[key]:
+                Metric.objects.filter(id=existing[key][0]).update(value=gauges[key])
+        Metric.objects.bulk_create([Metric(name=name, secret_id=secret_id, node=None, value=gauges[(name, secret_id)]) for name, secret_id in gauges.keys() - existing.keys()])
+    return len(gauges)
+
+
 def update_create_metrics(secret, node):
     # add penalty points for a new meeting on the node
     node = Node.objects.get(uuid=node.uuid)
@@ -47,3 +152,74 @@ def update_create_metrics(secret, node):
 
     # update metric stats
     incr_metric(Metric.CREATED, secret, node)
+
+
+def get_metrics_exposition(secret: Union[Secret, None] = None) -> str:
+    """
+    Render metrics in prometheus exposition format.
+    Metric rows are aggregated by a single GROUP BY query for the scope of the secret:
+     - sub_id 0 secret: all secrets of the tenant, labeled by tenant slug (sum) and secret slug (sub_id != 0)
+     - other secrets: the secret only
+     - None: all secrets and nodes
+    """
+    if secret is None:
+        secrets = Secret.objects.select_related("tenant")
+        metrics = Metric.objects.all()
+    elif secret.sub_id == 0:
+        secrets = Secret.objects.select_related("tenant").filter(tenant=secret.tenant)
+        metrics = Metric.objects.filter(secret__tenant=secret.tenant)
+    else:
+        secrets = [secret]
+        metrics = Metric.objects.filter(secret=secret)
+
+    lines: List[str] = []
+    labels: Dict[tuple, str] = {}
+    tenant_slugs = set()
+    tenant_limits = []
+    secret_limits = []
+    for scope_secret in secrets:
+        if scope_secret.sub_id == 0:
+            label = scope_secret.tenant.slug
+            tenant_slugs.add(label)
+            tenant_limits.append((label, scope_secret.tenant.attendee_limit, scope_secret.tenant.meeting_limit))
+        else:
+            label = scope_secret.__str__()
+            labels[(scope_secret.tenant.slug, scope_secret.sub_id)] = label
+        secret_limits.append((label, scope_secret.attendee_limit, scope_secret.meeting_limit))
+
+    values: Dict[str, Dict[str, int]] = {name: {} for name, _ in Metric.NAME_CHOICES}
+    for row in metrics.values("name", "secret__tenant__slug", "secret__sub_id").annotate(value=Sum("value")).order_by():
+        name_values = values.setdefault(row["name"], {})
+        tenant_slug = row["secret__tenant__slug"]
+        if tenant_slug in tenant_slugs:
+            name_values[tenant_slug] = name_values.get(tenant_slug, 0) + row["value"]
+        label = labels.get((tenant_slug, row["secret__sub_id"]))
+        if label:
+            name_values[label] = name_values.get(label, 0) + row["value"]
+
+    if secret is None:
+        lines += ["# HELP b3lb_node_load Calculated node load", "# TYPE b3lb_node_load gauge"]
+        for node in Node.objects.select_related("cluster"):
+            lines.append(f'b3lb_node_load{{node="{node.slug}",cluster="{node.cluster.name}"}} {node.load}')
+
+    if tenant_limits:
+        lines += ["# HELP b3lb_tenant_attendee_limit Attendee limit per tenant", "# TYPE b3lb_tenant_attendee_limit gauge"]
+        lines += [f'b3lb_tenant_attendee_limit{{tenant="{slug}"}} {attendee}' for slug, attendee, meeting in tenant_limits]
+        lines += ["# HELP b3lb_tenant_meeting_limit Meeting limit per tenant", "# TYPE b3lb_tenant_meeting_limit gauge"]
+        lines += [f'b3lb_tenant_meeting_limit{{tenant="{slug}"}} {meeting}' for slug, attendee, meeting in tenant_limits]
+
+    lines += ["# HELP b3lb_secret_attendee_limit Attendee limit per secret", "# TYPE b3lb_secret_attendee_limit gauge"]
+    lines += [f'b3lb_secret_attendee_limit{{secret="{slug}"}} {attendee}' for slug, attendee, meeting in secret_limits]
+    lines += ["# HELP b3lb_secret_meeting_limit Meeting limit per secret", "# TYPE b3lb_secret_meeting_limit gauge"]
+    lines += [f'b3lb_secret_meeting_limit{{secret="{slug}"}} {meeting}' for slug, attendee, meeting in secret_limits]
+
+    metric_helps = dict(Metric.NAME_CHOICES)
+    for name, name_values in values.items():
+        if not name_values:
+            continue
+        lines.append(f"# HELP b3lb_{name} {metric_helps.get(name, name)}")
+        lines.append(f"# TYPE b3lb_{name} {'gauge' if name in Metric.GAUGES else 'counter'}")
+        for label, value in sorted(name_values.items()):
+            lines.append(f'b3lb_{name}{{secret="{label}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,84 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import namedtuple
+from json import dump, load
+from os import replace, stat
+from os.path import join, realpath, relpath
+from typing import Any, Dict, Union
+
+# sidecar file of discovered media info in the extracted raw archive
+PROBE_FILE = "probe.json"
+
+MediaInfo = namedtuple('MediaInfo', ['width', 'height', 'duration', 'is_image', 'framerate_num', 'framerate_denom', 'rate', 'channels'])
+
+
+class ProbeCache:
+    """
+    Media info (dimensions, duration, stream info) of discovered files, stored as JSON sidecar in basedir,
+    so it is available without GStreamer assets, e.g. for the video duration of stored records.
+    Entries are keyed by path relative to basedir and invalidated by size and modification time.
+    """
+    path: str
+    basedir: str
+    entries: Dict[str, Dict[str, Any]]
+    changed: bool
+
+    def __init__(self, basedir: str):
+        self.path = join(basedir, PROBE_FILE)
+        self.basedir = realpath(basedir)
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(self.path) as fh:
+                self.entries = load(fh)
+        except (OSError, ValueError):
+            pass
+
+    def _get_key(self, path: str) -> str:
+        path = realpath(path)
+        key = relpath(path, self.basedir)
+        if key.startswith(".."):
+            return path
+        return key
+
+    @staticmethod
+    def _get_stamp(path: str) -> list:
+        stat_result = stat(path)
+        return [stat_result.st_size, stat_result.st_mtime_ns]
+
+    def get(self, path: str) -> Union[MediaInfo, None]:
+        entry = self.entries.get(self._get_key(path))
+        try:
+            if entry is None or entry["stamp"] != self._get_stamp(path):
+                return None
+            return MediaInfo(**entry["info"])
+        except (OSError, KeyError, TypeError):
+            return None
+
+    def set(self, path: str, info: MediaInfo) -> MediaInfo:
+        self.entries[self._get_key(path)] = {"stamp": self._get_stamp(path), "info": info._asdict()}
+        self.changed = True
+        return info
+
+    def save(self):
+        if not self.changed:
+            return
+        with open(f"{self.path}.tmp", "w") as fh:
+            dump(self.entries, fh)
+        replace(f"{self.path}.tmp", self.path)
+        self.changed = False
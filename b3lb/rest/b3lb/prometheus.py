@@ -0,0 +1,118 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from celery.signals import task_postrun, task_prerun
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from os import environ
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+from time import perf_counter
+from typing import Any, Dict, List, Union
+
+
+REQUEST_DURATION = Histogram("b3lb_request_duration_seconds", "Duration of BBB API requests", ["endpoint"])
+REQUEST_QUERIES = Histogram("b3lb_request_db_queries", "Number of database queries per BBB API request", ["endpoint"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, float("inf")))
+NODE_POLL_DURATION = Histogram("b3lb_node_poll_duration_seconds", "Duration of node polls", ["node"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf")))
+NODE_POLL_SIZE = Histogram("b3lb_node_poll_xml_bytes", "Size of getMeetings XML returned by node polls", ["node"], buckets=(1e3, 1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, float("inf")))
+TASK_DURATION = Histogram("b3lb_task_duration_seconds", "Runtime of celery tasks", ["task"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, float("inf")))
+CACHE_LOOKUPS = Counter("b3lb_cache_lookups", "Cache lookups by cache and result", ["cache", "result"])
+
+request_queries: ContextVar[Union[List[int], None]] = ContextVar("request_queries", default=None)
+task_starts: Dict[str, float] = {}
+
+
+class RequestObserver:
+    """
+    Context manager measuring duration and database queries of a request.
+    The query counter is a mutable list, so queries of sync_to_async threads (copied context) are counted, too.
+    """
+    endpoint: str
+    start: float
+    queries: List[int]
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.queries = [0]
+        self.token = request_queries.set(self.queries)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if settings.B3LB_PROMETHEUS:
+            REQUEST_DURATION.labels(endpoint=self.endpoint).observe(perf_counter() - self.start)
+            REQUEST_QUERIES.labels(endpoint=self.endpoint).observe(self.queries[0])
+        request_queries.reset(self.token)
+        return False
+
+
+def count_query(execute, sql, params, many, context):
+    queries = request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def observe_cache(cache_name: str, value: Any) -> Any:
+    """
+    Count cache lookup as hit or miss and return looked up value.
+    """
+    if settings.B3LB_PROMETHEUS:
+        CACHE_LOOKUPS.labels(cache=cache_name, result="miss" if value is None else "hit").inc()
+    return value
+
+
+def observe_node_poll(node_slug: str, duration: float, xml_size: int = 0):
+    if settings.B3LB_PROMETHEUS:
+        NODE_POLL_DURATION.labels(node=node_slug).observe(duration)
+        if xml_size:
+            NODE_POLL_SIZE.labels(node=node_slug).observe(xml_size)
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    task_starts[task_id] = perf_counter()
+
+
+def task_finished(task_id=None, task=None, **kwargs):
+    start = task_starts.pop(task_id, None)
+    if start is not None and task is not None:
+        TASK_DURATION.labels(task=task.name).observe(perf_counter() - start)
+
+
+def get_exposition() -> bytes:
+    """
+    Render all collected values, merged over all processes if PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+if settings.B3LB_PROMETHEUS:
+    connection_created.connect(install_query_counter, dispatch_uid="b3lb_prometheus_query_counter")
+    task_prerun.connect(task_started, dispatch_uid="b3lb_prometheus_task_prerun")
+    task_postrun.connect(task_finished, dispatch_uid="b3lb_prometheus_task_postrun")
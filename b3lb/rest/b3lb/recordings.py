@@ -0,0 +1,124 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from asgiref.sync import sync_to_async
+from django.db.models.query import QuerySet
+from itertools import islice
+from rest.b3lb.utils import xml_escape
+from rest.models import Record
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Union
+
+# max. number of recordings per getRecordings page (BigBlueButton 2.6+ pagination)
+MAX_LIMIT = 100
+# records fetched per database round trip while serializing
+ITERATOR_CHUNK_SIZE = 500
+
+
+def get_bool_string(value: Any) -> str:
+    return "true" if value else "false"
+
+
+def get_recording_xml(record: Dict[str, Any]) -> str:
+    """
+    Serialize recording dict of Record.get_recording_dict to a getRecordings <recording> element.
+    """
+    breakout = ""
+    if not record["is_breakout"]:
+        breakout = """
+            <breakout>
+                <parentId>unknown</parentId>
+                <sequence>0</sequence>
+                <freeJoin>false</freeJoin>
+            </breakout>"""
+    end_callback_url = ""
+    if record["end_callback_url"]:
+        end_callback_url = f"""
+                <endcallbackurl>{xml_escape(record["end_callback_url"])}</endcallbackurl>"""
+
+    return f"""
+        <recording>
+            <recordID>{record["uuid"]}</recordID>
+            <meetingID>{xml_escape(record["meeting_id"])}</meetingID>
+            <internalMeetingID>{xml_escape(record["internal_meeting_id"])}</internalMeetingID>
+            <name>{xml_escape(record["name"])}</name>
+            <isBreakout>{get_bool_string(record["is_breakout"])}</isBreakout>
+            <published>{get_bool_string(record["published"])}</published>
+            <state>{record["state"]}</state>
+            <startTime>{xml_escape(record["start_time"])}</startTime>
+            <endTime>{xml_escape(record["end_time"])}</endTime>
+            <participants>{record["participants"]}</participants>
+            <rawSize>{record["raw_size"]}</rawSize>
+            <metadata>
+                <bbb-origin>{xml_escape(record["bbb_origin"])}</bbb-origin>
+                <bbb-origin-server-name>{xml_escape(record["bbb_origin_server_name"])}</bbb-origin-server-name>
+                <bbb-origin-version>{xml_escape(record["bbb_origin_version"])}</bbb-origin-version>{end_callback_url}
+                <gl-listed>{record["gl_listed"]}</gl-listed>
+                <isBreakout>{get_bool_string(record["is_breakout"])}</isBreakout>
+                <meetingId>{xml_escape(record["meeting_id"])}</meetingId>
+                <meetingName>{xml_escape(record["meeting_name"])}</meetingName>
+            </metadata>{breakout}
+            <size>{record["video_size"]}</size>
+            <playback>
+                <format>
+                    <type>presentation</type>
+                    <url>{record["video_url"]}</url>
+                    <processingTime>0</processingTime>
+                    <length>{record["video_length"]}</length>
+                    <size>{record["video_size"]}</size>
+                </format>
+            </playback>
+            <data></data>
+        </recording>"""
+
+
+def update_missing_file_sizes(records: QuerySet):
+    """
+    Look up sizes of records rendered before sizes were stored, so they pass the file size filter.
+    Each record is looked up only once, missing files are stored as size 0.
+    """
+    for record in records.filter(file_size__isnull=True):
+        record.get_file_size()
+
+
+def iter_recordings_xml(records: Iterable[Record], total_elements: Union[int, None] = None) -> Iterator[str]:
+    """
+    getRecordings response, records are fetched and serialized one by one.
+    totalElements is added for paginated requests.
+    """
+    yield "<response>\n    <returncode>SUCCESS</returncode>\n    <recordings>"
+    for record in records:
+        yield get_recording_xml(record.get_recording_dict())
+    yield "\n    </recordings>"
+    if total_elements is not None:
+        yield f"\n    <totalElements>{total_elements}</totalElements>"
+    yield "\n</response>\n"
+
+
+async def aiter_recordings_xml(records: QuerySet, total_elements: Union[int, None] = None) -> AsyncIterator[str]:
+    """
+    Async variant of iter_recordings_xml for ASGI servers, chunks of records are fetched and serialized in a worker thread.
+    """
+    recordings_xml = iter_recordings_xml(records.iterator(chunk_size=ITERATOR_CHUNK_SIZE), total_elements)
+    get_chunk = sync_to_async(lambda: "".join(islice(recordings_xml, ITERATOR_CHUNK_SIZE)))
+    try:
+        while True:
+            chunk = await get_chunk()
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(recordings_xml.close)()
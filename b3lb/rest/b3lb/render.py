@@ -0,0 +1,94 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from django.conf import settings
+from fcntl import LOCK_EX, LOCK_NB, flock
+from math import ceil
+from os import makedirs, path, sched_getaffinity, sched_setaffinity
+from rest.models import RecordProfile
+from typing import Callable, Dict, List, TextIO
+
+
+def get_render_cpus() -> List[int]:
+    """
+    CPUs usable for rendering, limited to B3LB_RENDER_THREADS if set.
+    """
+    cpus = sorted(sched_getaffinity(0))
+    if settings.B3LB_RENDER_THREADS > 0:
+        return cpus[:settings.B3LB_RENDER_THREADS]
+    return cpus
+
+
+def get_job_threads(record_profile: RecordProfile, cpus: int) -> int:
+    """
+    Number of threads of a render job, scaled by the resolution of the profile.
+    """
+    return max(1, min(cpus, ceil(record_profile.width * record_profile.height / settings.B3LB_RENDER_PIXELS_PER_THREAD)))
+
+
+class CpuBudget:
+    """
+    Host wide CPU budget of render jobs.
+    CPUs are reserved by locking one lock file per CPU, so all render workers of a host share the budget.
+    """
+    cpus: List[int]
+    lock_dir: str
+    reserved: Dict[int, TextIO]
+
+    def __init__(self, lock_dir: str):
+        self.cpus = get_render_cpus()
+        self.lock_dir = lock_dir
+        self.reserved = {}
+        makedirs(lock_dir, exist_ok=True)
+
+    def acquire(self, count: int) -> List[int]:
+        """
+        Reserve count free CPUs without blocking, empty if not enough CPUs are free.
+        """
+        acquired = {}
+        for cpu in self.cpus:
+            if len(acquired) >= count:
+                break
+            if cpu in self.reserved:
+                continue
+            fh = open(path.join(self.lock_dir, f"cpu-{cpu}.lock"), "a")
+            try:
+                flock(fh, LOCK_EX | LOCK_NB)
+                acquired[cpu] = fh
+            except BlockingIOError:
+                fh.close()
+        if len(acquired) < count:
+            for fh in acquired.values():
+                fh.close()
+            return []
+        self.reserved.update(acquired)
+        return list(acquired)
+
+    def release(self, cpus: List[int]):
+        for cpu in cpus:
+            fh = self.reserved.pop(cpu, None)
+            if fh:
+                fh.close()
+
+    @staticmethod
+    def pin(cpus: List[int]) -> Callable:
+        """
+        Returns preexec function for Popen, binding the child process to the reserved CPUs.
+        """
+        def set_affinity():
+            sched_setaffinity(0, cpus)
+        return set_affinity
@@ -0,0 +1,201 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from intervaltree import IntervalTree
+from os.path import join
+from typing import Callable, Dict, List, Tuple
+from xml.etree import ElementTree
+
+# GStreamer's content detection doesn't work well with ElementTree's
+# automatically assigned namespace prefixes.
+ElementTree.register_namespace("", "http://www.w3.org/2000/svg")
+
+# timeline helpers of make_xges without GStreamer dependency, times in nanoseconds (Gst.SECOND)
+SECOND = 1000000000
+
+SlideInfo = namedtuple('SlideInfo', ['id', 'width', 'height', 'start', 'end'])
+CursorEvent = namedtuple('CursorEvent', ['x', 'y', 'start'])
+AnnotationFrame = namedtuple('AnnotationFrame', ['name', 'info', 'start', 'end', 'svg'])
+CursorClip = namedtuple('CursorClip', ['start', 'end', 'x', 'y'])
+
+
+def get_slides(doc: ElementTree.ElementTree) -> Dict[str, SlideInfo]:
+    slides = {}
+    for img in doc.iterfind('./{http://www.w3.org/2000/svg}image[@class="slide"]'):
+        info = SlideInfo(
+            id=img.get('id'),
+            width=int(img.get('width')),
+            height=int(img.get('height')),
+            start=round(float(img.get('in')) * SECOND),
+            end=round(float(img.get('out')) * SECOND),
+        )
+        slides[info.id] = info
+    return slides
+
+
+def get_annotation_frames(doc: ElementTree.ElementTree, slides: Dict[str, SlideInfo], start_time: int, end_time: int, dedup: bool = False) -> List[AnnotationFrame]:
+    """
+    Split annotations of all canvases into frames of constant visible shapes.
+    Frames are built incrementally by sweeping over the start and end times of the shapes.
+    With dedup, frames with identical SVG content share one file (named by content hash)
+    and consecutive identical frames of a canvas are merged into one.
+    """
+    frames = []
+    for canvas in doc.iterfind('./{http://www.w3.org/2000/svg}g[@class="canvas"]'):
+        info = slides[canvas.get('image')]
+        starts: Dict[int, List[Tuple[int, ElementTree.Element]]] = {}
+        ends: Dict[int, List[int]] = {}
+        for index, shape in enumerate(canvas.iterfind('./{http://www.w3.org/2000/svg}g[@class="shape"]')):
+            shape.set('style', shape.get('style').replace(
+                'visibility:hidden;', ''))
+            timestamp = round(float(shape.get('timestamp')) * SECOND)
+            undo = round(float(shape.get('undo')) * SECOND)
+            if undo < 0:
+                undo = info.end
+            if dedup:
+                # timing attributes aren't rendered, drop them so equal shapes compare equal
+                shape.attrib.pop('timestamp', None)
+                shape.attrib.pop('undo', None)
+
+            # Clip timestamps to slide visibility
+            start = min(max(timestamp, info.start), info.end)
+            end = min(max(undo, info.start), info.end)
+
+            # Don't bother creating annotations for out of range or empty times
+            if end < start_time or start > end_time or start >= end:
+                continue
+
+            starts.setdefault(start, []).append((index, shape))
+            ends.setdefault(end, []).append(index)
+
+        visible: Dict[int, ElementTree.Element] = {}
+        times = sorted(set(starts) | set(ends))
+        previous = None
+        interval_index = 0
+        for begin, end in zip(times, times[1:]):
+            for index in ends.get(begin, []):
+                del visible[index]
+            for index, shape in starts.get(begin, []):
+                visible[index] = shape
+            if not visible:
+                continue
+
+            svg = ElementTree.Element('{http://www.w3.org/2000/svg}svg')
+            svg.set('version', '1.1')
+            svg.set('width', '{}px'.format(info.width))
+            svg.set('height', '{}px'.format(info.height))
+            svg.set('viewBox', '0 0 {} {}'.format(info.width, info.height))
+
+            # We want to discard all but the last version of each
+            # shape ID, which requires two passes.
+            shapes = sorted(visible.items())
+            shape_index = {}
+            for index, shape in shapes:
+                shape_index[shape.get('shape')] = index
+            for index, shape in shapes:
+                if shape_index[shape.get('shape')] != index: continue
+                svg.append(shape)
+
+            data = ElementTree.tostring(svg, xml_declaration=True)
+            if not dedup:
+                frames.append(AnnotationFrame('annotations-{}-{}.svg'.format(info.id, interval_index), info, begin, end, data))
+                interval_index += 1
+                continue
+
+            name = 'annotations-{}.svg'.format(sha256(data).hexdigest()[:32])
+            if previous and previous.name == name and previous.end == begin:
+                previous = frames[-1] = previous._replace(end=end)
+            else:
+                previous = AnnotationFrame(name, info, begin, end, data)
+                frames.append(previous)
+    return frames
+
+
+def get_cursor_events(cursor_doc: ElementTree.ElementTree) -> List[CursorEvent]:
+    events = []
+    for event in cursor_doc.iterfind('./event'):
+        x, y = event.find('./cursor').text.split()
+        start = round(float(event.attrib['timestamp']) * SECOND)
+        events.append(CursorEvent(float(x), float(y), start))
+    return events
+
+
+def get_cursor_clips(events: List[CursorEvent], slide_time: IntervalTree, dimensions: Callable[[SlideInfo], Tuple[int, int]], dot_size: Tuple[int, int], end_time: int, compact: bool = False, frame_duration: int = 0) -> List[CursorClip]:
+    """
+    Convert cursor events to clips with pixel positions of the cursor dot.
+    Dimensions of the current slide are cached while events are inside of its interval.
+    With compact, events not moving the dot by a pixel extend the current clip and
+    events replaced before the next video frame (of frame_duration) are dropped.
+    """
+    dot_width, dot_height = dot_size
+    clips = []
+    current = None
+    info = None
+    width, height = 0, 0
+    for i, pos in enumerate(events):
+        # Show cursor until next event or if it is the last event,
+        # the end of recording.
+        end = events[i + 1].start if i + 1 < len(events) else end_time
+        if compact and frame_duration and -(-pos.start // frame_duration) * frame_duration >= end:
+            continue
+
+        # negative positions are used to indicate that no cursor
+        # should be displayed.
+        place = None
+        if not (pos.x < 0 and pos.y < 0):
+            # Find the width/height of the slide corresponding to this
+            # point in time
+            if info is None or not info.start <= pos.start < info.end:
+                info_list = [interval.data for interval in slide_time.at(pos.start)]
+                info = info_list[0] if info_list else None
+                if info:
+                    width, height = dimensions(info)
+            if info:
+                place = (round(width*pos.x - dot_width/2), round(height*pos.y - dot_height / 2))
+
+        if not compact:
+            if place:
+                clips.append(CursorClip(pos.start, end, *place))
+            continue
+
+        if current and place == (current.x, current.y):
+            continue
+        if current:
+            clips.append(current._replace(end=pos.start))
+        current = CursorClip(pos.start, None, *place) if place else None
+
+    if current:
+        clips.append(current._replace(end=end_time))
+    return clips
+
+
+def write_annotation_files(frames: List[AnnotationFrame], workdir: str, threads: int = 1) -> int:
+    """
+    Write SVG file of each distinct frame name in parallel, returns number of written files.
+    """
+    files = {frame.name: frame.svg for frame in frames}
+
+    def write_file(name: str):
+        with open(join(workdir, name), 'wb') as fp:
+            fp.write(files[name])
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        list(executor.map(write_file, files))
+    return len(files)
@@ -0,0 +1,221 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from base64 import b64encode
+from botocore.exceptions import ClientError
+from django.conf import settings
+from fcntl import LOCK_EX, LOCK_NB, flock
+from hashlib import sha256
+from math import ceil
+from os import makedirs, path, remove, scandir
+from re import fullmatch
+from rest.b3lb.archive import ZSTD, ZSTD_MAGIC, TAR
+from storages.utils import clean_name, safe_join
+from time import time
+from typing import Any, BinaryIO, Dict, List
+
+
+UPLOAD_READ_SIZE = 1048576
+
+# S3 limits of multipart uploads
+S3_MAX_PARTS = 10000
+S3_MIN_PART_SIZE = 5242880
+
+
+def get_upload_path(nonce: str) -> str:
+    return path.join(settings.B3LB_RECORD_UPLOAD_DIR, f"{sha256(nonce.encode()).hexdigest()}.part")
+
+
+def get_upload_offset(upload_path: str) -> int:
+    try:
+        return path.getsize(upload_path)
+    except FileNotFoundError:
+        return -1
+
+
+def create_upload(upload_path: str):
+    """
+    Create empty staging file of a new upload and remove expired unfinished uploads.
+    """
+    makedirs(settings.B3LB_RECORD_UPLOAD_DIR, exist_ok=True)
+    expired = time() - settings.B3LB_RECORD_UPLOAD_EXPIRY * 3600
+    for entry in scandir(settings.B3LB_RECORD_UPLOAD_DIR):
+        if entry.name.endswith(".part") and entry.stat().st_mtime < expired:
+            remove(entry.path)
+    open(upload_path, "ab").close()
+
+
+def write_upload_chunk(upload_path: str, offset: int, stream: BinaryIO, checksum: str) -> bool:
+    """
+    Write chunk read from stream at offset of the staging file, staged data behind offset is discarded.
+    The chunk is rejected if offset is behind the staged size, the SHA-256 checksum mismatches
+    or another chunk of the same upload is written concurrently.
+    """
+    digest = sha256()
+    with open(upload_path, "r+b") as fh:
+        try:
+            flock(fh, LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            return False
+        if fh.seek(0, 2) < offset:
+            return False
+        fh.truncate(offset)
+        fh.seek(offset)
+        valid = False
+        try:
+            while True:
+                data = stream.read(UPLOAD_READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                fh.write(data)
+            valid = digest.hexdigest() == checksum.lower()
+        finally:
+            if not valid:
+                fh.truncate(offset)
+    return valid
+
+
+def get_upload_sha256(upload_path: str) -> str:
+    digest = sha256()
+    with open(upload_path, "rb") as fh:
+        while True:
+            data = fh.read(UPLOAD_READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def is_presigned_upload() -> bool:
+    return settings.B3LB_RECORD_UPLOAD_PRESIGN and settings.B3LB_RECORD_STORAGE == "s3"
+
+
+def get_storage_key(storage, name: str) -> str:
+    """
+    Object key of a file name in the S3 bucket (including the storage location), normalized like S3Storage.save().
+    """
+    return safe_join(storage.location, clean_name(name))
+
+
+def get_upload_part_size(size: int) -> int:
+    return max(settings.B3LB_RECORD_UPLOAD_PART_SIZE, S3_MIN_PART_SIZE, ceil(size / S3_MAX_PARTS))
+
+
+def get_part_checksums(value: str, size: int) -> List[str]:
+    """
+    Parse comma separated SHA-256 checksums (hex) of all parts of an upload, empty if invalid.
+    """
+    checksums = value.lower().split(",")
+    if len(checksums) != max(1, ceil(size / get_upload_part_size(size))):
+        return []
+    for checksum in checksums:
+        if not fullmatch(r"[0-9a-f]{64}", checksum):
+            return []
+    return checksums
+
+
+def get_s3_checksum(checksum: str) -> str:
+    """
+    S3 representation (base64) of a SHA-256 checksum (hex).
+    """
+    return b64encode(bytes.fromhex(checksum)).decode()
+
+
+def get_composite_checksum(checksums: List[str]) -> str:
+    """
+    S3 checksum of a completed multipart upload: SHA-256 of the concatenated part checksums, suffixed by the part count.
+    """
+    return f"{b64encode(sha256(bytes.fromhex(''.join(checksums))).digest()).decode()}-{len(checksums)}"
+
+
+def get_multipart_upload_id(storage, key: str) -> str:
+    """
+    Lookup id of an unfinished multipart upload of key, empty if there is none.
+    Uploads without SHA-256 part checksums are aborted.
+    """
+    client = storage.connection.meta.client
+    upload_id = ""
+    for upload in client.list_multipart_uploads(Bucket=storage.bucket_name, Prefix=key).get("Uploads", []):
+        if upload["Key"] != key:
+            continue
+        if upload.get("ChecksumAlgorithm") == "SHA256" and not upload_id:
+            upload_id = upload["UploadId"]
+        else:
+            abort_presigned_upload(storage, key, upload["UploadId"])
+    return upload_id
+
+
+def get_multipart_parts(storage, key: str, upload_id: str) -> List[Dict[str, Any]]:
+    client = storage.connection.meta.client
+    parts = []
+    for page in client.get_paginator("list_parts").paginate(Bucket=storage.bucket_name, Key=key, UploadId=upload_id):
+        parts.extend(page.get("Parts", []))
+    return parts
+
+
+def get_presigned_upload(storage, key: str, size: int, checksums: List[str]) -> Dict[str, Any]:
+    """
+    Create or continue a multipart upload of key and presign urls of all parts, which are not uploaded yet.
+    Urls are signed with the SHA-256 checksum of the part, which is verified by S3 and has to be sent as x-amz-checksum-sha256 header.
+    """
+    client = storage.connection.meta.client
+    part_size = get_upload_part_size(size)
+
+    uploaded = set()
+    upload_id = get_multipart_upload_id(storage, key)
+    if upload_id:
+        for part in get_multipart_parts(storage, key, upload_id):
+            if part["PartNumber"] <= len(checksums) and part.get("ChecksumSHA256") == get_s3_checksum(checksums[part["PartNumber"] - 1]):
+                uploaded.add(part["PartNumber"])
+    else:
+        upload_id = client.create_multipart_upload(Bucket=storage.bucket_name, Key=key, ChecksumAlgorithm="SHA256")["UploadId"]
+
+    parts = []
+    for number, checksum in enumerate(checksums, 1):
+        if number not in uploaded:
+            params = {"Bucket": storage.bucket_name, "Key": key, "UploadId": upload_id, "PartNumber": number, "ChecksumSHA256": get_s3_checksum(checksum)}
+            url = client.generate_presigned_url("upload_part", Params=params, ExpiresIn=settings.B3LB_RECORD_UPLOAD_PRESIGN_EXPIRY)
+            parts.append({"number": number, "offset": (number - 1) * part_size, "size": min(part_size, size - (number - 1) * part_size), "checksum": params["ChecksumSHA256"], "url": url})
+    return {"upload_id": upload_id, "part_size": part_size, "parts": parts}
+
+
+def abort_presigned_upload(storage, key: str, upload_id: str):
+    storage.connection.meta.client.abort_multipart_upload(Bucket=storage.bucket_name, Key=key, UploadId=upload_id)
+
+
+def complete_presigned_upload(storage, key: str, upload_id: str, checksums: List[str]) -> Dict[str, Any]:
+    """
+    Complete multipart upload with the parts known by S3, an already completed upload is skipped.
+    S3 rejects the completion if a part checksum differs from the given checksums.
+    Returns size, codec (by magic bytes) and S3 checksum of the resulting object, the object is not read.
+    """
+    client = storage.connection.meta.client
+    try:
+        parts = []
+        for part in get_multipart_parts(storage, key, upload_id):
+            if part["PartNumber"] <= len(checksums):
+                parts.append({"PartNumber": part["PartNumber"], "ETag": part["ETag"], "ChecksumSHA256": get_s3_checksum(checksums[part["PartNumber"] - 1])})
+        client.complete_multipart_upload(Bucket=storage.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") != "NoSuchUpload":
+            raise
+    head = client.head_object(Bucket=storage.bucket_name, Key=key, ChecksumMode="ENABLED")
+    magic = b""
+    if head["ContentLength"]:
+        magic = client.get_object(Bucket=storage.bucket_name, Key=key, Range=f"bytes=0-{len(ZSTD_MAGIC) - 1}")["Body"].read()
+    return {"size": head["ContentLength"], "codec": ZSTD if magic == ZSTD_MAGIC else TAR, "checksum": head.get("ChecksumSHA256", "")}
@@ -16,6 +16,9 @@
 
 # This utils file contains functions without import of b3lb files to prevent circular imports
 from _hashlib import HASH
+from asgiref.sync import sync_to_async
+from re import fullmatch
+from typing import AsyncIterator, BinaryIO, Iterator, Tuple, Union
 from xml.sax.saxutils import escape
 
 
@@ -28,3 +31,59 @@ def xml_escape(string: str) -> str:
         return escape(string)
     else:
         return ""
+
+
+def parse_range_header(header: str, size: int) -> Union[Tuple[int, int], None]:
+    """
+    Parse single byte range of Range header into first and last byte position.
+    Returns None for missing, invalid or multiple ranges (serve whole file),
+    a first byte position >= size means the range is not satisfiable.
+    """
+    if not header:
+        return None
+    matched = fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not matched or not (matched.group(1) or matched.group(2)):
+        return None
+    if not matched.group(1):
+        # suffix range: last n bytes
+        suffix = int(matched.group(2))
+        if suffix == 0:
+            return size, size - 1
+        return max(0, size - suffix), size - 1
+    first = int(matched.group(1))
+    last = int(matched.group(2)) if matched.group(2) else size - 1
+    if first >= size:
+        return first, last
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+def iter_file_chunks(fh: BinaryIO, length: int, chunk_size: int) -> Iterator[bytes]:
+    """
+    Read up to length bytes from file handle in chunks and close it afterwards.
+    """
+    try:
+        while length > 0:
+            chunk = fh.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+async def aiter_file_chunks(fh: BinaryIO, length: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Async variant of iter_file_chunks for ASGI servers, file reads run in a worker thread.
+    """
+    try:
+        while length > 0:
+            chunk = await sync_to_async(fh.read)(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(fh.close)()
@@ -20,24 +20,33 @@ from aiohttp.web_request import URL
 from asgiref.sync import sync_to_async
 from asyncio import create_task
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Sum
 from django.db.models.query import QuerySet, Q
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseForbidden, HttpHeaders
-from django.template.loader import render_to_string
-from json import dumps
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, HttpResponseForbidden, HttpHeaders, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from _hashlib import HASH
+from os import path, remove
 from random import randint
 from requests import get
 from requests.exceptions import RequestException
-from rest.b3lb.metrics import incr_metric, update_create_metrics
+from rest.b3lb.archive import ARCHIVE_NAMES, get_archive_codec
+from rest.b3lb.metrics import get_metrics_exposition, incr_metric, update_create_metrics
+from rest.b3lb.prometheus import observe_cache
+from rest.b3lb.recordings import ITERATOR_CHUNK_SIZE, MAX_LIMIT, aiter_recordings_xml, iter_recordings_xml, update_missing_file_sizes
+from rest.b3lb.upload import abort_presigned_upload, complete_presigned_upload, create_upload, get_composite_checksum, get_part_checksums, get_presigned_upload, get_storage_key, get_upload_offset, get_upload_part_size, get_upload_path, get_upload_sha256, is_presigned_upload, write_upload_chunk
 from rest.parameters import BLOCK, OVERRIDE, PARAMETERS_CREATE, PARAMETERS_JOIN, SET
 from rest.parameters.create import ALLOW_START_STOP_RECORDING, AUTO_START_RECORDING, LOGO, RECORD
 from rest.parameters.join import USERDATA_BBB_CUSTOM_STYLE_URL
 from rest.b3lb.utils import get_checksum
-from rest.models import ClusterGroupRelation, Meeting, Metric, Node, Parameter, Record, RecordSet, Secret, SecretMeetingList, SecretMetricsList, Stats
-from typing import Any, Dict, List, Literal, Union
+from rest.task.core import get_secret_meetings_xml
+from rest.task.statistics import get_tenant_statistics
+from rest.models import ClusterGroupRelation, Meeting, Metric, Node, Parameter, Record, RecordSet, Secret, SecretMeetingList
+from typing import Any, Dict, List, Literal, Tuple, Union
 from uuid import UUID
 from urllib.parse import urlencode
 from xmltodict import parse
@@ -154,7 +163,10 @@ class ClientB3lbRequest:
         """
         'getMeetings' endpoint.
         Returns cached data to client.
+        Compact (attendee-less) data is pre-rendered, the full variant is rendered on demand.
         """
+        if not self.is_compact_get_meetings():
+            return HttpResponse(await sync_to_async(self.get_secret_meetings_full)(), content_type=cst.CONTENT_TYPE)
         try:
             secret_meeting_list = await sync_to_async(SecretMeetingList.objects.get)(secret=self.secret)
             return HttpResponse(secret_meeting_list.xml, content_type=cst.CONTENT_TYPE)
@@ -168,20 +180,44 @@ class ClientB3lbRequest:
         if not self.secret.is_record_enabled:
             return HttpResponse(cst.RETURN_STRING_GET_RECORDING_NO_RECORDINGS, content_type=cst.CONTENT_TYPE)
 
-        records = []
+        page = await sync_to_async(self.get_recordings_page)()
+        if page is None:
+            return HttpResponse(cst.RETURN_STRING_GET_RECORDING_NO_RECORDINGS, content_type=cst.CONTENT_TYPE)
+
+        # records are fetched and serialized while streaming, in a worker thread on ASGI servers
+        recordings, total_elements = page
+        if isinstance(self.request, ASGIRequest):
+            return StreamingHttpResponse(aiter_recordings_xml(recordings, total_elements), content_type=cst.CONTENT_TYPE)
+        return StreamingHttpResponse(iter_recordings_xml(recordings.iterator(chunk_size=ITERATOR_CHUNK_SIZE), total_elements), content_type=cst.CONTENT_TYPE)
+
+    def get_recordings_page(self) -> Union[Tuple[QuerySet, Union[int, None]], None]:
+        """
+        Requested page of recordings with video file and totalElements for paginated requests, None if there is none.
+        """
         recording_ids = self.parameters.get("recordID", "")
         if recording_ids:
-            for recording_id in recording_ids.split(","):
-                records = await sync_to_async(self.get_recording_dicts)(records, recording_id=recording_id)
+            recordings = self.filter_recordings_by_ids(recording_ids=recording_ids.split(","))
         elif self.meeting_id:
-            for meeting_id in self.meeting_id.split(","):
-                records = await sync_to_async(self.get_recording_dicts)(records, meeting_id=meeting_id)
+            recordings = self.filter_recordings_by_ids(meeting_ids=self.meeting_id.split(","))
         else:
-            records = await sync_to_async(self.get_recording_dicts)(records)
+            recordings = self.filter_recordings()
 
-        if records:
-            return HttpResponse(render_to_string(template_name="getRecordings.xml", context={"records": records}), content_type=cst.CONTENT_TYPE)
-        return HttpResponse(cst.RETURN_STRING_GET_RECORDING_NO_RECORDINGS, content_type=cst.CONTENT_TYPE)
+        # records without video file are filtered before counting and slicing
+        update_missing_file_sizes(recordings)
+        recordings = recordings.filter(file_size__gt=0)
+
+        offset, limit = self.get_pagination()
+        total = recordings.count()
+        if total <= offset:
+            return None
+
+        # stable order for pagination, records are fetched in chunks
+        recordings = recordings.select_related("record_set", "profile").order_by("record_set__created_at", "uuid")
+        if limit:
+            recordings = recordings[offset:offset + limit]
+        elif offset:
+            recordings = recordings[offset:]
+        return recordings, total if "offset" in self.parameters or "limit" in self.parameters else None
 
     async def publish_recordings(self) -> HttpResponse:
         """
@@ -315,7 +351,7 @@ class ClientB3lbRequest:
 
     async def metrics(self) -> HttpResponse:
         """
-        Return cached prometheus metrics.
+        Return prometheus metrics, rendered on demand and cached for a short time.
         Must be authorized by stats_token
         """
         if self.get_forwarded_host() == settings.B3LB_API_BASE_DOMAIN or (self.stats_token and self.secret and self.stats_token == str(self.secret.tenant.stats_token)):
@@ -325,7 +361,11 @@ class ClientB3lbRequest:
 
     async def stats(self) -> HttpResponse:
         if self.stats_token and self.secret and self.secret.tenant and self.stats_token == str(self.secret.tenant.stats_token):
-            return HttpResponse(await sync_to_async(self.get_tenant_statistic)(), content_type='application/json')
+            statistic = await sync_to_async(self.get_tenant_statistic)()
+            response = HttpResponse(statistic["json"], content_type='application/json')
+            response["ETag"] = statistic["etag"]
+            response["Last-Modified"] = http_date(statistic["last_modified"])
+            return get_conditional_response(self.request, etag=statistic["etag"], last_modified=statistic["last_modified"], response=response)
         else:
             return HttpResponse("Unauthorized", status=401)
 
@@ -335,6 +375,50 @@ class ClientB3lbRequest:
             return ["GET"]
         return ["GET", "POST"]
 
+    def get_pagination(self) -> Tuple[int, int]:
+        """
+        Offset and limit (0: unlimited) of getRecordings pagination, limit is capped to 1..100 like BigBlueButton.
+        """
+        try:
+            offset = max(0, int(self.parameters.get("offset", 0)))
+        except ValueError:
+            offset = 0
+        try:
+            limit = int(self.parameters.get("limit", 0))
+        except ValueError:
+            limit = 0
+        if "limit" in self.parameters:
+            limit = min(max(1, limit), MAX_LIMIT)
+        return offset, limit
+
+    def filter_recordings_by_ids(self, meeting_ids: Union[List[str], None] = None, recording_ids: Union[List[str], None] = None) -> QuerySet[Record]:
+        """
+        Single IN query for lists of meeting or recording ids, invalid ids are skipped.
+        """
+        if self.state and self.state not in ["unpublished", "published"]:
+            return Record.objects.none()  # return empty QuerySet if state isn't in allowed states
+
+        query = Q(record_set__secret=self.secret)
+
+        if recording_ids is not None:
+            valid_ids = []
+            for recording_id in recording_ids:
+                try:
+                    valid_ids.append(UUID(recording_id))
+                except ValueError:
+                    continue
+            query &= Q(uuid__in=valid_ids)
+
+        if meeting_ids is not None:
+            query &= Q(record_set__meta_meeting_id__in=[meeting_id for meeting_id in meeting_ids if 2 <= len(meeting_id) <= cst.MEETING_ID_LENGTH])
+
+        if self.state == "published":
+            query &= Q(published=True)
+        elif self.state == "unpublished":
+            query &= Q(published=False)
+
+        return Record.objects.filter(query)
+
     def filter_recordings(self, meeting_id: str = "", recording_id: str = "") -> QuerySet[Record]:
         if self.state and self.state not in ["unpublished", "published"]:
             return Record.objects.none()  # return empty QuerySet if state isn't in allowed states
@@ -443,6 +527,12 @@ class ClientB3lbRequest:
             return True
         return False
 
+    def is_compact_get_meetings(self) -> bool:
+        compact = self.parameters.get("compact", "").lower()
+        if compact in ["true", "false"]:
+            return compact == "true"
+        return self.secret.meetings_compact
+
     def is_in_limit(self) -> bool:
         """
         Check meeting and attendee limit for secret and tenant.
@@ -499,6 +589,11 @@ class ClientB3lbRequest:
     def get_node_endpoint_url_encoded(self) -> URL:
         return URL(self.get_node_endpoint_url(), encoded=True)
 
+    def get_endpoint_label(self) -> str:
+        if self.endpoint in self.ENDPOINTS or self.endpoint in self.ENDPOINTS_PASS_THROUGH:
+            return self.endpoint or "version"
+        return "unknown"
+
     def get_forwarded_host(self) -> str:
         return cst.HOST_REGEX.sub(r'\1', self.request.META.get('HTTP_X_FORWARDED_HOST', self.request.META.get('HTTP_HOST')))
 
@@ -509,14 +604,21 @@ class ClientB3lbRequest:
         query_string = query_string.replace("checksum=" + self.checksum, "")
         return query_string
 
-    def get_recording_dicts(self, records: List[Dict[str, Any]], meeting_id: str = "", recording_id: str = "") -> List[Dict[str, Any]]:
-        for record in self.filter_recordings(meeting_id=meeting_id, recording_id=recording_id):
-            if record.get_file_size() > 0:
-                records.append(record.get_recording_dict())
-        return records
+    def get_secret_meetings_full(self) -> str:
+        cache_key = settings.B3LB_CACHE_SML_PATTERN.format(self.secret.uuid)
+        xml = observe_cache("sml", cache.get(cache_key))
+        if xml is None:
+            xml = get_secret_meetings_xml(self.secret)
+            cache.set(cache_key, xml, timeout=settings.B3LB_CACHE_SML_TIMEOUT)
+        return xml
 
     def get_secret_metrics(self) -> str:
-        return SecretMetricsList.objects.get(secret=self.secret).metrics
+        cache_key = settings.B3LB_CACHE_METRICS_PATTERN.format(self.secret.uuid if self.secret else "all")
+        metrics = observe_cache("metrics", cache.get(cache_key))
+        if metrics is None:
+            metrics = get_metrics_exposition(self.secret)
+            cache.set(cache_key, metrics, timeout=settings.B3LB_CACHE_METRICS_TIMEOUT)
+        return metrics
 
     def get_sha_by_length(self) -> Union[HASH, None]:
         return cst.SHA_ALGORITHMS.get(len(self.checksum))
@@ -524,20 +626,8 @@ class ClientB3lbRequest:
     def get_sha_by_parameter(self) -> Union[HASH, None]:
         return cst.SHA_ALGORITHMS.get(self.parameters.get("checksumHash", ""))
 
-    def get_tenant_statistic(self) -> str:
-        statistic = {}
-        for stat in Stats.objects.filter(tenant=self.secret.tenant):
-            if stat.bbb_origin_server_name not in statistic:
-                statistic[stat.bbb_origin_server_name] = {}
-            statistic[stat.bbb_origin_server_name][stat.bbb_origin] = {
-                "participantCount": stat.attendees,
-                "listenerCount": stat.listenerCount,
-                "voiceParticipantCount": stat.voiceParticipantCount,
-                "moderatorCount": stat.moderatorCount,
-                "videoCount": stat.videoCount,
-                "meetingCount": stat.meetings
-            }
-        return dumps(statistic)
+    def get_tenant_statistic(self) -> Dict[str, Any]:
+        return get_tenant_statistics(str(self.secret.tenant_id))
 
     ## Setter Routines ##
     async def set_node_by_meeting_id(self):
@@ -603,7 +693,12 @@ class NodeB3lbRequest:
         self.recording_marks = self.request.GET.get("recordingmarks", "false")
         self.BACKENDS = {
             "meeting/end": {"methods": ["GET"], "function": self.end_meeting},
-            "record/upload": {"methods": ["POST"], "function": self.upload_record}
+            "record/upload": {"methods": ["POST"], "function": self.upload_record},
+            "record/session": {"methods": ["POST"], "function": self.upload_session},
+            "record/chunk": {"methods": ["POST"], "function": self.upload_chunk},
+            "record/commit": {"methods": ["POST"], "function": self.upload_commit},
+            "record/presign": {"methods": ["POST"], "function": self.upload_presign},
+            "record/finalize": {"methods": ["POST"], "function": self.upload_finalize}
         }
 
     def is_allowed_endpoint(self) -> bool:
@@ -672,6 +767,31 @@ class NodeB3lbRequest:
                 print(f"Exception: {rex}")
                 print(f"Couldn't send callback to URL: {url}")
 
+    def get_upload_meta(self) -> Dict[str, Any]:
+        """
+        Parse uploaded metadata.xml of recording, empty if missing or invalid.
+        """
+        uploaded_meta = self.request.FILES.get("meta", {})
+        if not uploaded_meta:
+            return {}
+        meta = parse(uploaded_meta.read()).get("recording", {})
+        if not isinstance(meta, dict):
+            return {}
+        return meta
+
+    @staticmethod
+    def set_record_set_meta(record_set: RecordSet, meta: Dict[str, Any]):
+        record_set.meta_bbb_origin = meta.get("meta", {}).get("bbb-origin", "")
+        record_set.meta_bbb_origin_server_name = meta.get("meta", {}).get("bbb-origin-server-name", "")
+        record_set.meta_bbb_origin_version = meta.get("meta", {}).get("bbb-origin-version", "")
+        if meta.get("meta", {}).get("gl-listed", "false") == "true":
+            record_set.meta_gl_listed = True
+        record_set.meta_meeting_name = meta.get("meeting", {}).get("@name", "")
+        record_set.meta_start_time = meta.get("start_time", "")
+        record_set.meta_end_time = meta.get("end_time", "")
+        record_set.meta_participants = int(meta.get("participants", "1"))
+        record_set.status = record_set.UPLOADED
+
     async def upload_record(self) -> HttpResponse:
         record_set: RecordSet
         if not self.nonce:
@@ -685,34 +805,232 @@ class NodeB3lbRequest:
         if not uploaded_file:
             return HttpResponse(status=400)
 
-        uploaded_meta = self.request.FILES.get("meta", {})
-        if not uploaded_meta:
+        meta = self.get_upload_meta()
+        if not meta:
             return HttpResponse(status=400)
 
-        meta = parse(uploaded_meta.read()).get("recording", {})
+        if meta.get("meta", {}).get("isBreakout", "false") == "true":
+            return HttpResponse(status=403) # no support for breakout room recordings currently
 
-        if not meta or not isinstance(meta, dict):
+        codec = get_archive_codec(uploaded_file)
+        if codec not in settings.B3LB_RECORD_ARCHIVE_CODECS:
+            uploaded_file.close()
+            return HttpResponse(status=415)
+
+        # pass the temporary file to the storage, which moves (local) or uploads it chunked (s3)
+        record_set.raw_size = uploaded_file.size
+        try:
+            await sync_to_async(record_set.recording_archive.save)(name=f"{record_set.file_path}/{ARCHIVE_NAMES[codec]}", content=uploaded_file)
+        except:
+            return HttpResponse("Error during file save", status=503)
+        finally:
+            uploaded_file.close()
+
+        self.set_record_set_meta(record_set, meta)
+        await sync_to_async(record_set.save)()
+
+        return HttpResponse(status=204)
+
+    async def upload_session(self) -> HttpResponse:
+        """
+        Create or resume a resumable upload of the recording archive.
+        Returns the staged size as offset to continue with, the accepted archive codecs and
+        whether presigned uploads directly to the S3 bucket are available.
+        """
+        if not self.nonce:
+            return HttpResponse(status=400)
+
+        record_set = await sync_to_async(self.get_record_set_by_nonce)()
+        if not record_set:
+            return HttpResponse(status=404)
+
+        if record_set.status != RecordSet.UNKNOWN:
+            return JsonResponse({"uploaded": True, "offset": 0, "chunk_size": settings.B3LB_RECORD_UPLOAD_CHUNK_SIZE, "codecs": settings.B3LB_RECORD_ARCHIVE_CODECS, "presign": is_presigned_upload()})
+
+        upload_path = get_upload_path(self.nonce)
+        offset = await sync_to_async(get_upload_offset)(upload_path)
+        if offset < 0:
+            await sync_to_async(create_upload)(upload_path)
+            offset = 0
+        return JsonResponse({"uploaded": False, "offset": offset, "chunk_size": settings.B3LB_RECORD_UPLOAD_CHUNK_SIZE, "codecs": settings.B3LB_RECORD_ARCHIVE_CODECS, "presign": is_presigned_upload()})
+
+    async def upload_chunk(self) -> HttpResponse:
+        """
+        Write a chunk of the recording archive at offset (up to the staged size), verified by its SHA-256 checksum.
+        Conflicting or rejected chunks are answered with the current offset.
+        """
+        checksum = self.request.GET.get("sha256", "")
+        try:
+            offset = int(self.request.GET.get("offset", ""))
+        except ValueError:
+            return HttpResponse(status=400)
+        if not self.nonce or not checksum:
+            return HttpResponse(status=400)
+        if int(self.request.headers.get("Content-Length", 0) or 0) > settings.B3LB_RECORD_UPLOAD_CHUNK_SIZE:
+            return HttpResponse(status=413)
+
+        record_set = await sync_to_async(self.get_record_set_by_nonce)()
+        upload_path = get_upload_path(self.nonce)
+        current = await sync_to_async(get_upload_offset)(upload_path)
+        if not record_set or record_set.status != RecordSet.UNKNOWN or current < 0:
+            return HttpResponse(status=404)
+        if current < offset:
+            return JsonResponse({"offset": current}, status=409)
+
+        if not await sync_to_async(write_upload_chunk)(upload_path, offset, self.request, checksum):
+            return JsonResponse({"offset": await sync_to_async(get_upload_offset)(upload_path)}, status=422)
+        return JsonResponse({"offset": await sync_to_async(get_upload_offset)(upload_path)})
+
+    def commit_upload(self, record_set: RecordSet, upload_path: str) -> bool:
+        """
+        Move staged archive to the storage, named by its detected codec.
+        An archive of a codec, which is not accepted, is discarded.
+        """
+        with open(upload_path, "rb") as fh:
+            codec = get_archive_codec(fh)
+            if codec in settings.B3LB_RECORD_ARCHIVE_CODECS:
+                record_set.raw_size = path.getsize(upload_path)
+                record_set.recording_archive.save(name=f"{record_set.file_path}/{ARCHIVE_NAMES[codec]}", content=File(fh), save=False)
+        remove(upload_path)
+        return codec in settings.B3LB_RECORD_ARCHIVE_CODECS
+
+    async def upload_commit(self) -> HttpResponse:
+        """
+        Finish resumable upload: verify size and SHA-256 checksum of the staged archive and move it to the storage.
+        A staged archive with mismatching checksum is discarded.
+        """
+        checksum = self.request.GET.get("sha256", "")
+        try:
+            size = int(self.request.GET.get("size", ""))
+        except ValueError:
+            return HttpResponse(status=400)
+        if not self.nonce or not checksum:
+            return HttpResponse(status=400)
+
+        record_set = await sync_to_async(self.get_record_set_by_nonce)()
+        upload_path = get_upload_path(self.nonce)
+        current = await sync_to_async(get_upload_offset)(upload_path)
+        if not record_set or record_set.status != RecordSet.UNKNOWN or current < 0:
+            return HttpResponse(status=404)
+
+        meta = self.get_upload_meta()
+        if not meta:
             return HttpResponse(status=400)
 
         if meta.get("meta", {}).get("isBreakout", "false") == "true":
+            await sync_to_async(remove)(upload_path)
             return HttpResponse(status=403) # no support for breakout room recordings currently
 
+        if current != size:
+            return JsonResponse({"offset": current}, status=409)
+
+        if await sync_to_async(get_upload_sha256)(upload_path) != checksum.lower():
+            await sync_to_async(remove)(upload_path)
+            return JsonResponse({"offset": 0}, status=422)
+
         try:
-            await sync_to_async(record_set.recording_archive.save)(name=f"{record_set.file_path}/raw.tar", content=ContentFile(uploaded_file.read()))
+            if not await sync_to_async(self.commit_upload)(record_set, upload_path):
+                return HttpResponse(status=415)
         except:
             return HttpResponse("Error during file save", status=503)
 
-        record_set.meta_bbb_origin = meta.get("meta", {}).get("bbb-origin", "")
-        record_set.meta_bbb_origin_server_name = meta.get("meta", {}).get("bbb-origin-server-name", "")
-        record_set.meta_bbb_origin_version = meta.get("meta", {}).get("bbb-origin-version", "")
-        if meta.get("meta", {}).get("gl-listed", "false") == "true":
-            record_set.meta_gl_listed = True
-        record_set.meta_meeting_name = meta.get("meeting", {}).get("@name", "")
-        record_set.meta_start_time = meta.get("start_time", "")
-        record_set.meta_end_time = meta.get("end_time", "")
-        record_set.meta_participants = int(meta.get("participants", "1"))
+        self.set_record_set_meta(record_set, meta)
+        await sync_to_async(record_set.save)()
 
-        record_set.status = record_set.UPLOADED
+        return HttpResponse(status=204)
+
+    def get_presign_key(self, record_set: RecordSet) -> Union[str, None]:
+        """
+        Object key of the recording archive by requested codec, None if codec is not accepted.
+        """
+        codec = self.request.GET.get("codec", "tar")
+        if codec not in ARCHIVE_NAMES or codec not in settings.B3LB_RECORD_ARCHIVE_CODECS:
+            return None
+        return f"{record_set.file_path}/{ARCHIVE_NAMES[codec]}"
+
+    async def upload_presign(self) -> HttpResponse:
+        """
+        Create or continue a multipart upload of the recording archive directly to the S3 bucket.
+        Returns presigned urls of all parts not uploaded yet, signed with their SHA-256 checksums (POST field sha256, comma separated hex).
+        Without checksums only the part size is returned.
+        """
+        try:
+            size = int(self.request.GET.get("size", ""))
+        except ValueError:
+            return HttpResponse(status=400)
+        if not self.nonce or size < 0:
+            return HttpResponse(status=400)
+        if not is_presigned_upload():
+            return HttpResponse(status=404)
+
+        record_set = await sync_to_async(self.get_record_set_by_nonce)()
+        if not record_set or record_set.status != RecordSet.UNKNOWN:
+            return HttpResponse(status=404)
+
+        name = self.get_presign_key(record_set)
+        if not name:
+            return HttpResponse(status=415)
+
+        if not self.request.POST.get("sha256"):
+            return JsonResponse({"part_size": get_upload_part_size(size)})
+        checksums = get_part_checksums(self.request.POST["sha256"], size)
+        if not checksums:
+            return HttpResponse(status=400)
+
+        storage = record_set.recording_archive.storage
+        try:
+            upload = await sync_to_async(get_presigned_upload)(storage, get_storage_key(storage, name), size, checksums)
+        except:
+            return HttpResponse("Error during presigning", status=503)
+        return JsonResponse(upload)
+
+    async def upload_finalize(self) -> HttpResponse:
+        """
+        Complete multipart upload to the S3 bucket, verify size, codec and SHA-256 part checksums (POST field sha256, comma separated hex)
+        of the archive by the checksum S3 stores for the object and store the metadata.
+        An archive failing verification is deleted from the bucket.
+        """
+        upload_id = self.request.GET.get("upload_id", "")
+        try:
+            size = int(self.request.GET.get("size", ""))
+        except ValueError:
+            return HttpResponse(status=400)
+        checksums = get_part_checksums(self.request.POST.get("sha256", ""), size)
+        if not self.nonce or not upload_id or not checksums:
+            return HttpResponse(status=400)
+        if not is_presigned_upload():
+            return HttpResponse(status=404)
+
+        record_set = await sync_to_async(self.get_record_set_by_nonce)()
+        if not record_set or record_set.status != RecordSet.UNKNOWN:
+            return HttpResponse(status=404)
+
+        name = self.get_presign_key(record_set)
+        if not name:
+            return HttpResponse(status=415)
+
+        meta = self.get_upload_meta()
+        if not meta:
+            return HttpResponse(status=400)
+
+        storage = record_set.recording_archive.storage
+        key = get_storage_key(storage, name)
+        if meta.get("meta", {}).get("isBreakout", "false") == "true":
+            await sync_to_async(abort_presigned_upload)(storage, key, upload_id)
+            return HttpResponse(status=403) # no support for breakout room recordings currently
+
+        try:
+            upload = await sync_to_async(complete_presigned_upload)(storage, key, upload_id, checksums)
+        except:
+            return HttpResponse("Error during upload completion", status=503)
+
+        if upload["size"] != size or upload["checksum"] != get_composite_checksum(checksums) or name != f"{record_set.file_path}/{ARCHIVE_NAMES[upload['codec']]}":
+            await sync_to_async(storage.delete)(name)
+            return HttpResponse(status=422)
+
+        record_set.recording_archive.name = name
+        record_set.raw_size = upload["size"]
+        self.set_record_set_meta(record_set, meta)
         await sync_to_async(record_set.save)()
 
         return HttpResponse(status=204)
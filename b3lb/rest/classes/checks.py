@@ -1,4 +1,5 @@
 from rest.b3lb.utils import get_checksum
+from rest.classes.statistics import MeetingStats
 from rest.models import Node
 
 from typing import Any, Dict, List
@@ -12,6 +13,7 @@ class NodeCheck:
     attendees: int
     meetings: int
     meeting_stats: Dict[str, Dict[str, Any]]
+    tenant_stats: Dict[str, Dict[str, Dict[str, MeetingStats]]]
 
     def add_meeting_to_stats(self, meeting_id: str):
         self.meeting_stats[meeting_id] = {}
@@ -20,6 +22,18 @@ class NodeCheck:
         for param in self.PARAMETERS_STR:
             self.meeting_stats[meeting_id][param] = ""
 
+    def add_tenant_stats(self, tenant_uuid: str, meeting_id: str):
+        stats = self.meeting_stats[meeting_id]
+        origins = self.tenant_stats.setdefault(tenant_uuid, {}).setdefault(stats["bbb-origin-server-name"] or "", {})
+        origin_stats = origins.setdefault(stats["bbb-origin"] or "", MeetingStats())
+        origin_stats.add_meeting_stats(stats["participantCount"], stats["listenerCount"], stats["voiceParticipantCount"], stats["moderatorCount"], stats["videoCount"])
+
+    def get_tenant_stats(self) -> Dict[str, Dict[str, Dict[str, List[int]]]]:
+        """
+        Per tenant and origin partial statistics of the node, reduced by rest.task.statistics.update_statistics.
+        """
+        return {tenant_uuid: {server: {origin: stats.get_values() for origin, stats in origins.items()} for server, origins in servers.items()} for tenant_uuid, servers in self.tenant_stats.items()}
+
     def get_meetings_url(self) -> str:
         return f"{self.node.api_base_url}getMeetings?checksum={get_checksum(self.node.cluster.get_sha(), f'getMeetings{self.node.secret}')}"
 
@@ -29,5 +43,6 @@ class NodeCheck:
         self.attendees = 0
         self.meetings = 0
         self.meeting_stats = {}
+        self.tenant_stats = {}
         self.PARAMETERS_INT = ["participantCount", "listenerCount", "voiceParticipantCount", "videoCount", "moderatorCount"]
         self.PARAMETERS_STR = ["bbb-origin", "bbb-origin-server-name"]
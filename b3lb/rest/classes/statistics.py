@@ -16,6 +16,14 @@ class MeetingStats:
         self.moderator_count += moderator_count
         self.video_count += video_count
 
+    def add_aggregated_stats(self, meetings: int, attendees: int, listener_count: int, voice_participant_count: int, moderator_count: int, video_count: int):
+        self.attendees += attendees
+        self.meetings += meetings
+        self.listener_count += listener_count
+        self.voice_participant_count += voice_participant_count
+        self.moderator_count += moderator_count
+        self.video_count += video_count
+
     def get_values(self) -> List[int]:
         return [self.meetings, self.attendees, self.listener_count, self.voice_participant_count, self.moderator_count, self.video_count]
 
@@ -0,0 +1,80 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2021 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+from rest.b3lb.timeline import get_annotation_frames, get_slides, write_annotation_files
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from xml.etree import ElementTree
+import json
+
+
+SVG = "http://www.w3.org/2000/svg"
+
+
+def generate_shapes(slides: int, shapes: int, versions: int) -> ElementTree.ElementTree:
+    """
+    Generate shapes.svg with drafts of each shape, like BBB stores pencil strokes and text edits.
+    Every third shape is erased again after it has been drawn.
+    """
+    root = ElementTree.Element(f"{{{SVG}}}svg")
+    for slide in range(slides):
+        ElementTree.SubElement(root, f"{{{SVG}}}image", {"class": "slide", "id": f"image{slide}", "width": "1600", "height": "900", "in": str(slide * 600), "out": str((slide + 1) * 600)})
+        canvas = ElementTree.SubElement(root, f"{{{SVG}}}g", {"class": "canvas", "image": f"image{slide}"})
+        for shape in range(shapes):
+            undo = slide * 600 + (shape + 0.75) * 500 / shapes if shape % 3 == 2 else -1
+            for version in range(versions):
+                timestamp = slide * 600 + shape * 500 / shapes + version * 0.5
+                element = ElementTree.SubElement(canvas, f"{{{SVG}}}g", {"class": "shape", "shape": f"shape{slide}-{shape}", "timestamp": str(timestamp), "undo": str(undo), "style": "stroke:#ff0000;visibility:hidden;"})
+                ElementTree.SubElement(element, f"{{{SVG}}}path", {"d": f"M{shape} {shape} L{shape + version} {shape + version * 2}"})
+    return ElementTree.ElementTree(root)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark generation of annotation frames and files with and without deduplication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shapes', nargs='?', help='path of shapes.svg, generated if omitted')
+        parser.add_argument('--slides', type=int, default=50, help='slides of generated shapes.svg')
+        parser.add_argument('--shapes', dest='shape_count', type=int, default=100, help='shapes per slide of generated shapes.svg')
+        parser.add_argument('--versions', type=int, default=10, help='drafts per shape of generated shapes.svg')
+        parser.add_argument('--threads', type=int, default=4, help='threads writing annotation files')
+
+    def handle(self, *args, **options):
+        results = {}
+        for dedup in [False, True]:
+            if options['shapes']:
+                doc = ElementTree.parse(options['shapes'])
+            else:
+                doc = generate_shapes(options['slides'], options['shape_count'], options['versions'])
+            slides = get_slides(doc)
+            end_time = max([info.end for info in slides.values()], default=0)
+
+            with TemporaryDirectory() as workdir:
+                start = perf_counter()
+                frames = get_annotation_frames(doc, slides, 0, end_time, dedup)
+                generated = perf_counter()
+                files = write_annotation_files(frames, workdir, options['threads'])
+                written = perf_counter()
+
+            results["dedup" if dedup else "plain"] = {
+                "clips": len(frames),
+                "files": files,
+                "bytes": sum(len(svg) for svg in {frame.name: frame.svg for frame in frames}.values()),
+                "generate_seconds": round(generated - start, 3),
+                "write_seconds": round(written - generated, 3),
+            }
+        self.stdout.write(json.dumps(results))
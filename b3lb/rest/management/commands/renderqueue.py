@@ -0,0 +1,38 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2021 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+from rest.models import RecordSet
+from rest.task.recording import get_render_queue
+import json
+
+
+class Command(BaseCommand):
+    help = 'Get render queue depth and estimated time (seconds) per tenant, prioritize RecordSets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prioritize', nargs='+', metavar='UUID', help='render RecordSets on demand')
+        parser.add_argument('--priority', type=int, default=RecordSet.PRIORITY_ON_DEMAND, help='render priority of prioritized RecordSets')
+
+    def handle(self, *args, **options):
+        if options['prioritize']:
+            count = RecordSet.objects.filter(uuid__in=options['prioritize']).update(render_priority=options['priority'])
+            # failed RecordSets are retried immediately
+            RecordSet.objects.filter(uuid__in=options['prioritize'], status__in=[RecordSet.UPLOADED, RecordSet.FAILED]).update(status=RecordSet.UPLOADED, render_attempts=0, render_failed_at=None)
+            self.stdout.write(f"Prioritized {count} RecordSets.")
+            return
+
+        self.stdout.write(json.dumps(get_render_queue()))
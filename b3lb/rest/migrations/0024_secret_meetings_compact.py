@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0023_alter_parameter_parameter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='secret',
+            name='meetings_compact',
+            field=models.BooleanField(default=False, help_text="Omit attendee lists in getMeetings responses (overridable by 'compact' parameter)."),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0024_secret_meetings_compact'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='SecretMetricsList',
+        ),
+    ]
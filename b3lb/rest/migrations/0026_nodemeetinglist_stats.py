@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0025_delete_secretmetricslist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodemeetinglist',
+            name='stats',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0026_nodemeetinglist_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(0, 'raw'), (60, '1 minute'), (3600, '1 hour')], default=0)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attendees', models.IntegerField(default=0)),
+                ('meetings', models.IntegerField(default=0)),
+                ('cpu_load', models.IntegerField(blank=True, null=True)),
+                ('node', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='rest.node')),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='rest.tenant')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['resolution', 'timestamp'], name='load_history_resolution')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0027_loadhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordset',
+            name='render_priority',
+            field=models.SmallIntegerField(default=0, help_text='render priority, higher values are rendered first'),
+        ),
+        migrations.AddField(
+            model_name='recordset',
+            name='render_queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recordset',
+            name='render_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recordset',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='recordset',
+            name='status',
+            field=models.CharField(choices=[('UNKNOWN', 'Recording state is unknown or meeting is running'), ('UPLOADED', 'Recording file has been uploaded'), ('QUEUED', 'Recording has been queued for rendering'), ('RENDERING', 'Recording is being rendered'), ('RENDERED', 'Recordings have been rendered to video files'), ('DELETING', 'Recordings will be deleted')], default='UNKNOWN', max_length=10),
+        ),
+    ]
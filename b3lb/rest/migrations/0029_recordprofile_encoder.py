@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0028_recordset_render_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordprofile',
+            name='encoder_preset',
+            field=models.CharField(choices=[('fastest', 'Fastest'), ('fast', 'Fast'), ('balanced', 'Balanced'), ('quality', 'Quality')], default='balanced', help_text='trade-off between encoding speed and quality', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='recordprofile',
+            name='encoder_threads',
+            field=models.PositiveSmallIntegerField(default=0, help_text='encoder threads, 0 for the CPUs reserved by the render job'),
+        ),
+        migrations.AddField(
+            model_name='recordprofile',
+            name='keyframe_interval',
+            field=models.PositiveIntegerField(default=0, help_text='maximum distance between keyframes in frames, 0 for encoder default'),
+        ),
+        migrations.AddField(
+            model_name='recordprofile',
+            name='video_bitrate',
+            field=models.PositiveIntegerField(default=0, help_text='video bitrate in kbit/s, 0 for encoder default'),
+        ),
+        migrations.AddField(
+            model_name='recordprofile',
+            name='video_codec',
+            field=models.CharField(choices=[('h264', 'H.264'), ('vp9', 'VP9'), ('av1', 'AV1')], default='h264', help_text="video codec, H.264 and AV1 for 'video/mp4', VP9 and AV1 for 'video/webm'", max_length=8),
+        ),
+    ]
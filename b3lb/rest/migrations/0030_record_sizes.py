@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0029_recordprofile_encoder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='duration',
+            field=models.IntegerField(default=0, help_text='length of video in seconds, 0 if unknown'),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='file_size',
+            field=models.BigIntegerField(default=0, help_text='size of video file in bytes, stored at rendering'),
+        ),
+        migrations.AddField(
+            model_name='recordset',
+            name='raw_size',
+            field=models.BigIntegerField(default=0, help_text='size of raw archive in bytes, stored at upload'),
+        ),
+    ]
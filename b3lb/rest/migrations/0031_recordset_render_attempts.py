@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0030_record_sizes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordset',
+            name='render_attempts',
+            field=models.PositiveSmallIntegerField(default=0, help_text='failed render attempts'),
+        ),
+        migrations.AddField(
+            model_name='recordset',
+            name='render_failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='recordset',
+            name='status',
+            field=models.CharField(choices=[('UNKNOWN', 'Recording state is unknown or meeting is running'), ('UPLOADED', 'Recording file has been uploaded'), ('QUEUED', 'Recording has been queued for rendering'), ('RENDERING', 'Recording is being rendered'), ('RENDERED', 'Recordings have been rendered to video files'), ('FAILED', 'Rendering failed repeatedly'), ('DELETING', 'Recordings will be deleted')], default='UNKNOWN', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0031_recordset_render_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordset',
+            name='render_heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0032_recordset_render_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricFlush',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('flushed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
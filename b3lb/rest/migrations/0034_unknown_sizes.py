@@ -0,0 +1,32 @@
+# Generated by Django 5.2.2 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+def reset_unknown_sizes(apps, schema_editor):
+    # size 0 was stored for files stored before sizes were stored, they are looked up once again
+    apps.get_model('rest', 'Record').objects.filter(file_size=0).update(file_size=None)
+    apps.get_model('rest', 'RecordSet').objects.filter(raw_size=0).update(raw_size=None)
+
+def restore_unknown_sizes(apps, schema_editor):
+    apps.get_model('rest', 'Record').objects.filter(file_size__isnull=True).update(file_size=0)
+    apps.get_model('rest', 'RecordSet').objects.filter(raw_size__isnull=True).update(raw_size=0)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0033_metricflush'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='record',
+            name='file_size',
+            field=models.BigIntegerField(default=None, help_text='size of video file in bytes, stored at rendering, 0 if missing', null=True),
+        ),
+        migrations.AlterField(
+            model_name='recordset',
+            name='raw_size',
+            field=models.BigIntegerField(default=None, help_text='size of raw archive in bytes, stored at upload, 0 if missing', null=True),
+        ),
+        migrations.RunPython(reset_unknown_sizes, restore_unknown_sizes),
+    ]
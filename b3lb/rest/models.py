@@ -30,6 +30,7 @@ from math import pow
 from os.path import join as path_join
 from re import match
 from rest.parameters import SET, OVERRIDE, MODE_CHOICES, PARAMETER_REGEXES, PARAMETER_CHOICES
+from rest.b3lb.encoding import AV1, BALANCED, CONTAINER_CODECS, FAST, FASTEST, H264, QUALITY, VP9
 from rest.b3lb.utils import xml_escape
 from rest.classes.statistics import MeetingStats
 from rest.classes.storage import DBStorage
@@ -47,6 +48,22 @@ def get_nonce():
     return get_random_string(cst.NONCE_LENGTH, cst.NONCE_CHAR_POOL)
 
 
+def get_file_size(field_file) -> int:
+    """
+    Size of a stored file by storage lookup (S3 HEAD request or stat), 0 if file is missing.
+    """
+    try:
+        return field_file.size
+    except FileNotFoundError:
+        return 0
+    except FileExistsError:
+        return 0
+    except ValueError:
+        return 0
+    except ClientError:
+        return 0
+
+
 def get_storage():
     if settings.B3LB_RECORD_STORAGE == "local":
         used_storage = FileSystemStorage()
@@ -146,6 +163,7 @@ class Node(models.Model):
 class NodeMeetingList(models.Model):
     node = models.OneToOneField(Node, on_delete=models.CASCADE, primary_key=True)
     xml = models.TextField(default="")
+    stats = models.JSONField(default=dict)
 
 
 def get_random_secret():
@@ -209,6 +227,7 @@ class Secret(models.Model):
     meeting_limit = models.IntegerField(default=0, validators=[MinValueValidator(0)], help_text="Max. number of meetings (0 = unlimited).")
     recording_enabled = models.BooleanField(default=True)
     records_hold_time = models.IntegerField(default=14, validators=[MinValueValidator(0)], help_text="Days interval before deleting records.")
+    meetings_compact = models.BooleanField(default=False, help_text="Omit attendee lists in getMeetings responses (overridable by 'compact' parameter).")
 
     class Meta(object):
         ordering = ['tenant__slug', 'sub_id']
@@ -305,17 +324,6 @@ class SecretMeetingList(models.Model):
     xml = models.TextField(default="")
 
 
-class SecretMetricsList(models.Model):
-    secret = models.OneToOneField(Secret, on_delete=models.CASCADE, unique=True, null=True)
-    metrics = models.TextField(default="")
-
-    def __str__(self):
-        if self.secret:
-            return self.secret.__str__()
-        else:
-            return "<<total>>"
-
-
 # meeting - tenant - node relation class
 class Meeting(models.Model):
     uuid = models.UUIDField(primary_key=True, editable=False, unique=True, default=uid.uuid4)
@@ -346,16 +354,25 @@ class Meeting(models.Model):
 class RecordSet(models.Model):
     UNKNOWN = "UNKNOWN"
     UPLOADED = "UPLOADED"
+    QUEUED = "QUEUED"
+    RENDERING = "RENDERING"
     RENDERED = "RENDERED"
+    FAILED = "FAILED"
     DELETING = "DELETING"
 
     STATUS_CHOICES = [
         (UNKNOWN, "Recording state is unknown or meeting is running"),
         (UPLOADED, "Recording file has been uploaded"),
+        (QUEUED, "Recording has been queued for rendering"),
+        (RENDERING, "Recording is being rendered"),
         (RENDERED, "Recordings have been rendered to video files"),
+        (FAILED, "Rendering failed repeatedly"),
         (DELETING, "Recordings will be deleted"),
     ]
 
+    # render priority of recordings requested on demand
+    PRIORITY_ON_DEMAND = 10
+
     uuid = models.UUIDField(primary_key=True, editable=False, unique=True, default=uid.uuid4)
     secret = models.ForeignKey(Secret, on_delete=models.CASCADE)
     meeting = models.ForeignKey(Meeting, on_delete=models.SET_NULL, null=True, blank=True)
@@ -366,6 +383,15 @@ class RecordSet(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="UNKNOWN")
     file_path = models.CharField(max_length=50)
 
+    # render scheduling
+    render_priority = models.SmallIntegerField(default=0, help_text="render priority, higher values are rendered first")
+    render_queued_at = models.DateTimeField(null=True, blank=True)
+    render_started_at = models.DateTimeField(null=True, blank=True)
+    render_heartbeat_at = models.DateTimeField(null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    render_attempts = models.PositiveSmallIntegerField(default=0, help_text="failed render attempts")
+    render_failed_at = models.DateTimeField(null=True, blank=True)
+
     # information from metadata.xml and Meeting
     meta_bbb_origin = models.CharField(max_length=20, default="")
     meta_bbb_origin_version = models.CharField(max_length=20, default="")
@@ -377,19 +403,26 @@ class RecordSet(models.Model):
     meta_start_time = models.CharField(max_length=14, default="")
     meta_end_time = models.CharField(max_length=14, default="")
     meta_participants = models.SmallIntegerField(default=0)
+    raw_size = models.BigIntegerField(null=True, default=None, help_text="size of raw archive in bytes, stored at upload, 0 if missing")
 
     def get_raw_size(self) -> int:
+        """
+        Stored size of raw archive, looked up once in the storage for record sets uploaded before sizes were stored.
+        A missing archive is stored as size 0, so the lookup is not repeated.
+        """
+        if self.raw_size is None:
+            self.raw_size = get_file_size(self.recording_archive)
+            RecordSet.objects.filter(uuid=self.uuid).update(raw_size=self.raw_size)
+        return self.raw_size
+
+    def get_duration(self) -> int:
+        """
+        Duration of recording in seconds from metadata (milliseconds timestamps), 0 if unknown.
+        """
         try:
-            return self.recording_archive.size
-        except FileNotFoundError:
-            return 0
-        except FileExistsError:
-            return 0
+            return max(0, (int(self.meta_end_time) - int(self.meta_start_time)) // 1000)
         except ValueError:
             return 0
-        except ClientError:
-            return 0
-
 
     def delete(self, using=None, keep_parents=False):
         try:
@@ -412,6 +445,9 @@ class RecordSet(models.Model):
 
 
 class RecordProfile(models.Model):
+    VIDEO_CODEC_CHOICES = [(H264, "H.264"), (VP9, "VP9"), (AV1, "AV1")]
+    ENCODER_PRESET_CHOICES = [(FASTEST, "Fastest"), (FAST, "Fast"), (BALANCED, "Balanced"), (QUALITY, "Quality")]
+
     uuid = models.UUIDField(primary_key=True, editable=False, unique=True, default=uid.uuid4)
     description = models.CharField(max_length=cst.RECORD_PROFILE_DESCRIPTION_LENGTH)
     name = models.CharField(max_length=32, unique=True)
@@ -426,6 +462,19 @@ class RecordProfile(models.Model):
     file_extension = models.CharField(max_length=10, default="mp4", help_text="video format, can be 'mp4' or 'webm'")
     is_default = models.BooleanField(default=False)
 
+    video_codec = models.CharField(max_length=8, choices=VIDEO_CODEC_CHOICES, default=H264, help_text="video codec, H.264 and AV1 for 'video/mp4', VP9 and AV1 for 'video/webm'")
+    encoder_preset = models.CharField(max_length=10, choices=ENCODER_PRESET_CHOICES, default=BALANCED, help_text="trade-off between encoding speed and quality")
+    video_bitrate = models.PositiveIntegerField(default=0, help_text="video bitrate in kbit/s, 0 for encoder default")
+    encoder_threads = models.PositiveSmallIntegerField(default=0, help_text="encoder threads, 0 for the CPUs reserved by the render job")
+    keyframe_interval = models.PositiveIntegerField(default=0, help_text="maximum distance between keyframes in frames, 0 for encoder default")
+
+    def clean_fields(self, exclude=None):
+        super().clean_fields(exclude=exclude)
+        if self.mime_type not in CONTAINER_CODECS:
+            raise ValidationError(f'Mime type must be one of {", ".join(CONTAINER_CODECS)}!', params={'mime_type': self.mime_type})
+        if self.video_codec not in CONTAINER_CODECS[self.mime_type]:
+            raise ValidationError(f'Video codec {self.video_codec} is not supported by {self.mime_type}!', params={'video_codec': self.video_codec})
+
     def __str__(self):
         return self.name
 
@@ -449,18 +498,26 @@ class Record(models.Model):
     record_set = models.ForeignKey(RecordSet, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(default=timezone.now)
     nonce = models.CharField(max_length=cst.NONCE_LENGTH, default=get_nonce, editable=False, unique=True)
+    file_size = models.BigIntegerField(null=True, default=None, help_text="size of video file in bytes, stored at rendering, 0 if missing")
+    duration = models.IntegerField(default=0, help_text="length of video in seconds, 0 if unknown")
 
     def get_file_size(self) -> int:
-        try:
-            return self.file.size
-        except FileNotFoundError:
-            return 0
-        except FileExistsError:
-            return 0
-        except ValueError:
-            return 0
-        except ClientError:
-            return 0
+        """
+        Stored size of video file, looked up once in the storage for records rendered before sizes were stored.
+        A missing file is stored as size 0, so the lookup is not repeated.
+        """
+        if self.file_size is None:
+            self.file_size = get_file_size(self.file)
+            Record.objects.filter(uuid=self.uuid).update(file_size=self.file_size)
+        return self.file_size
+
+    def get_video_length(self) -> int:
+        """
+        Length of video in minutes, by metadata of the record set if the video length is unknown.
+        """
+        if self.duration:
+            return self.duration // 60
+        return self.record_set.get_duration() // 60
 
     def delete(self, using=None, keep_parents=False):
         try:
@@ -482,8 +539,6 @@ class Record(models.Model):
         else:
             gl_listed = "false"
 
-        video_length = int((int(self.record_set.meta_end_time) - int(self.record_set.meta_start_time)) / 60000.)  # milliseconds to minutes
-
         record_dict = {
             "uuid": str(self.uuid),
             "meeting_id": self.record_set.meta_meeting_id,
@@ -504,7 +559,7 @@ class Record(models.Model):
             "meeting_name": self.record_set.meta_meeting_name,
             "video_size": self.get_file_size(),
             "video_url": f"https://{settings.B3LB_API_BASE_DOMAIN}/b3lb/r/{self.nonce}",
-            "video_length": video_length  # ToDo: Get length of video via routine?
+            "video_length": self.get_video_length()
         }
         return record_dict
 
@@ -527,12 +582,18 @@ class Stats(models.Model):
     class Meta(object):
         ordering = ['tenant']
 
-    def update_values(self, meeting: MeetingStats):
+    VALUE_FIELDS = ["attendees", "meetings", "listenerCount", "voiceParticipantCount", "moderatorCount", "videoCount"]
+
+    def set_values(self, meeting: MeetingStats):
         self.attendees = meeting.attendees
         self.meetings = meeting.meetings
         self.listenerCount = meeting.listener_count
+        self.voiceParticipantCount = meeting.voice_participant_count
         self.moderatorCount = meeting.moderator_count
         self.videoCount = meeting.video_count
+
+    def update_values(self, meeting: MeetingStats):
+        self.set_values(meeting)
         self.save()
 
     def __str__(self):
@@ -585,6 +646,46 @@ class Metric(models.Model):
         ]
 
 
+class MetricFlush(models.Model):
+    """
+    Ids of metric buffer flushes committed to the database.
+    A flush interrupted after the commit is recognized by its id and not applied twice.
+    """
+    id = models.CharField(primary_key=True, max_length=32)
+    flushed_at = models.DateTimeField(default=timezone.now)
+
+
+class LoadHistory(models.Model):
+    """
+    Append-only load samples of nodes (node set) and tenants (tenant set).
+    Rollups store the peak values of their interval.
+    """
+    RAW = 0
+    MINUTE = 60
+    HOUR = 3600
+
+    RESOLUTION_CHOICES = [
+        (RAW, "raw"),
+        (MINUTE, "1 minute"),
+        (HOUR, "1 hour")
+    ]
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, null=True, blank=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, null=True, blank=True)
+    resolution = models.PositiveIntegerField(choices=RESOLUTION_CHOICES, default=RAW)
+    timestamp = models.DateTimeField(default=timezone.now)
+    attendees = models.IntegerField(default=0)
+    meetings = models.IntegerField(default=0)
+    cpu_load = models.IntegerField(null=True, blank=True)
+
+    class Meta(object):
+        ordering = ['-timestamp']
+        indexes = [models.Index(fields=['resolution', 'timestamp'], name="load_history_resolution")]
+
+    def __str__(self):
+        return "{} {} ({})".format(self.node or self.tenant, self.timestamp, self.get_resolution_display())
+
+
 class Parameter(models.Model):
     mode = models.CharField(max_length=10, choices=MODE_CHOICES)
     parameter = models.CharField(max_length=64, choices=PARAMETER_CHOICES)
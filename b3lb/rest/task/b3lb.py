@@ -18,9 +18,10 @@
 from celery_singleton import Singleton
 from django.conf import settings
 from loadbalancer.celery import app
+from rest.b3lb.metrics import set_gauge_metrics
 from rest.classes.checks import NodeCheck
 from rest.task.core import check_node, generate_secret_get_meetings
-from rest.task.statistics import update_secret_metrics, update_tenant_statistics
+from rest.task.statistics import update_statistics
 from rest.models import Node, RecordSet, Secret
 
 ##
@@ -29,7 +30,10 @@ from rest.models import Node, RecordSet, Secret
 
 @app.task(ignore_result=True, base=Singleton, queue=settings.B3LB_TASK_QUEUE_CORE)
 def core_check_node(node_uuid: str):
-    return check_node(NodeCheck(Node.objects.get(uuid=node_uuid)))
+    result = check_node(NodeCheck(Node.objects.get(uuid=node_uuid)))
+    # reduce statistics partials of the poll
+    statistics_update_statistics.si().apply_async(queue=settings.B3LB_TASK_QUEUE_STATISTICS)
+    return result
 
 
 @app.task(ignore_result=True, base=Singleton, queue=settings.B3LB_TASK_QUEUE_CORE)
@@ -38,17 +42,17 @@ def core_generate_secret_meetings(secret_uuid: str):
 
 
 if settings.B3LB_RENDERING:
-    from rest.task.recording import render_record
+    from rest.task.recording import render_queued_record
     @app.task(ignore_result=True, base=Singleton, queue=settings.B3LB_TASK_QUEUE_RECORD)
     def recording_render_record(record_set_uuid: str):
-        return render_record(RecordSet.objects.get(uuid=record_set_uuid))
+        return render_queued_record(RecordSet.objects.get(uuid=record_set_uuid))
 
 
 @app.task(ignore_result=True, base=Singleton, queue=settings.B3LB_TASK_QUEUE_STATISTICS)
-def statistic_update_secret_metrics(secret_uuid: str):
-    return update_secret_metrics(secret_uuid)
+def statistics_update_gauge_metrics():
+    return f"Stored {set_gauge_metrics()} aggregated gauges."
 
 
 @app.task(ignore_result=True, base=Singleton, queue=settings.B3LB_TASK_QUEUE_STATISTICS)
-def statistics_update_tenant_statistics(tenant_uuid: str):
-    return update_tenant_statistics(tenant_uuid)
+def statistics_update_statistics():
+    return f"Updated {update_statistics()} statistics."
@@ -16,6 +16,7 @@
 
 
 from django.db import transaction
+from django.db.models import Q
 from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
@@ -23,8 +24,10 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from json import dumps
 from requests import get
+from time import perf_counter
 from rest.b3lb.constants import RETURN_STRING_GET_MEETINGS_NO_MEETINGS
-from rest.b3lb.metrics import incr_metric, set_metric
+from rest.b3lb.metrics import del_metric, incr_metric, set_metric
+from rest.b3lb.prometheus import observe_cache, observe_node_poll
 from rest.b3lb.utils import xml_escape
 from rest.classes.checks import NodeCheck
 from rest.models import Meeting, Metric, Node, NodeMeetingList, Secret, SecretMeetingList
@@ -32,6 +35,8 @@ from xml.etree import ElementTree
 
 
 def check_node(check: NodeCheck):
+    poll_start = perf_counter()
+    xml_size = 0
     try:
         response = get(check.node.load_base_url, timeout=settings.B3LB_NODE_REQUEST_TIMEOUT)
         if response.status_code == 200:
@@ -47,6 +52,7 @@ def check_node(check: NodeCheck):
     try:
         response = get(check.get_meetings_url(), timeout=settings.B3LB_NODE_REQUEST_TIMEOUT)
         if response.status_code == 200:
+            xml_size = len(response.content)
             get_meetings_text = response.content.decode('utf-8')
             cache.set(settings.B3LB_CACHE_NML_PATTERN.format(check.node.uuid), get_meetings_text, timeout=settings.B3LB_CACHE_NML_TIMEOUT)
             with transaction.atomic():
@@ -90,7 +96,7 @@ def check_node(check: NodeCheck):
     if check.has_errors:
         cache.set(settings.B3LB_CACHE_NML_PATTERN.format(check.node.uuid), RETURN_STRING_GET_MEETINGS_NO_MEETINGS, timeout=settings.B3LB_CACHE_NML_TIMEOUT)
         with transaction.atomic():
-            NodeMeetingList.objects.update_or_create(node=check.node, defaults={'xml': RETURN_STRING_GET_MEETINGS_NO_MEETINGS})
+            NodeMeetingList.objects.update_or_create(node=check.node, defaults={'xml': RETURN_STRING_GET_MEETINGS_NO_MEETINGS, 'stats': {}})
 
     with transaction.atomic():
         node = Node.objects.select_for_update().get(uuid=check.node.uuid)
@@ -100,6 +106,8 @@ def check_node(check: NodeCheck):
         node.save()
         load = node.load
 
+    observe_node_poll(check.node.slug, perf_counter() - poll_start, xml_size)
+
     if not check.has_errors:
         metrics = {}
         metric_keys = [
@@ -110,7 +118,7 @@ def check_node(check: NodeCheck):
             Metric.MEETINGS,
         ]
 
-        for meeting in Meeting.objects.filter(node=check.node):
+        for meeting in Meeting.objects.select_related("secret").filter(node=check.node):
             if meeting.id in check.meeting_stats:
                 if meeting.secret not in metrics:
                     metrics[meeting.secret] = {k: 0 for k in metric_keys}
@@ -135,6 +143,8 @@ def check_node(check: NodeCheck):
                 meeting.bbb_origin = check.meeting_stats[meeting.id]["bbb-origin"]
                 meeting.bbb_origin_server_name = check.meeting_stats[meeting.id]["bbb-origin-server-name"]
                 meeting.save()
+
+                check.add_tenant_stats(str(meeting.secret.tenant_id), meeting.id)
             else:
                 mci_lifetime = (timezone.now() - meeting.age).seconds
                 if mci_lifetime > 5:
@@ -145,39 +155,47 @@ def check_node(check: NodeCheck):
                         incr_metric(Metric.DURATION_SUM, meeting.secret, check.node, mci_lifetime)
                     meeting.delete()
 
+        NodeMeetingList.objects.filter(node=check.node).update(stats=check.get_tenant_stats())
+
         with transaction.atomic():
-            for secret in Secret.objects.all():
-                if secret in metrics:
-                    for name in metric_keys:
-                        if name in Metric.GAUGES:
+            if not settings.B3LB_METRIC_AGGREGATE_GAUGES:
+                # zero gauges are not stored, drop gauges of secrets without meetings on this node
+                # and aggregated gauges left over from B3LB_METRIC_AGGREGATE_GAUGES
+                Metric.objects.filter(Q(node=check.node) & ~Q(secret__in=metrics.keys()) | Q(node=None), name__in=Metric.GAUGES).delete()
+            for secret in metrics:
+                for name in metric_keys:
+                    if name in Metric.GAUGES:
+                        # aggregated gauges are stored by set_gauge_metrics
+                        if settings.B3LB_METRIC_AGGREGATE_GAUGES:
+                            continue
+                        if metrics[secret][name]:
                             set_metric(name, secret, check.node, metrics[secret][name])
                         else:
-                            incr_metric(name, secret, check.node, metrics[secret][name])
-                else:
-                    for name in metric_keys:
-                        if name in Metric.GAUGES:
-                            set_metric(name, secret, check.node, 0)
+                            del_metric(name, secret, check.node)
+                    else:
+                        incr_metric(name, secret, check.node, metrics[secret][name])
 
     return dumps([check.node.slug, load, check.meetings, check.attendees])
 
 
-def generate_secret_get_meetings(secret: Secret):
+def get_secret_meetings_xml(secret: Secret, attendees: bool = True) -> str:
+    """
+    Render getMeetings XML for secret from cached node meeting lists.
+    Attendee subtrees are skipped while parsing if attendees is False.
+    """
     if secret.sub_id == 0:
         mcis = Meeting.objects.filter(secret__tenant=secret.tenant)
     else:
         mcis = Meeting.objects.filter(secret=secret)
 
-    meeting_ids = []
-
-    for mci in mcis:
-        meeting_ids.append(mci.id)
+    meeting_ids = set(mcis.values_list("id", flat=True))
 
     context = {"meetings": []}
 
     for node in Node.objects.all():
         try:
             try:
-                node_meeting = cache.get(settings.B3LB_CACHE_NML_PATTERN.format(node.uuid))
+                node_meeting = observe_cache("nml", cache.get(settings.B3LB_CACHE_NML_PATTERN.format(node.uuid)))
                 if node_meeting is None:
                     node_meeting = NodeMeetingList.objects.get(node=node).xml
             except ObjectDoesNotExist:
@@ -192,6 +210,8 @@ def generate_secret_get_meetings(secret: Secret):
                             add_to_response = True
                             for sub_cat in category:
                                 if sub_cat.tag == "attendees":
+                                    if not attendees:
+                                        continue
                                     meeting_json["attendees"] = []
                                     for ssub_cat in sub_cat:
                                         if ssub_cat.tag == "attendee":
@@ -216,9 +236,13 @@ def generate_secret_get_meetings(secret: Secret):
             continue
 
     if context["meetings"]:
-        response = render_to_string(template_name="getMeetings.xml", context=context)
-    else:
-        response = RETURN_STRING_GET_MEETINGS_NO_MEETINGS
+        return render_to_string(template_name="getMeetings.xml", context=context)
+    return RETURN_STRING_GET_MEETINGS_NO_MEETINGS
+
+
+def generate_secret_get_meetings(secret: Secret):
+    # only the compact variant is pre-rendered, the full variant is rendered on demand
+    response = get_secret_meetings_xml(secret, attendees=False)
 
     with transaction.atomic():
         obj, created = SecretMeetingList.objects.update_or_create(secret=secret, defaults={'xml': response})
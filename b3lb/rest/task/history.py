@@ -0,0 +1,82 @@
+# B3LB - BigBlueButton Load Balancer
+# Copyright (C) 2020-2025 IBH IT-Service GmbH
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License
+# for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+from rest.models import LoadHistory, Node, Stats
+
+
+# (source resolution, target resolution, truncate function)
+ROLLUPS = [
+    (LoadHistory.RAW, LoadHistory.MINUTE, TruncMinute),
+    (LoadHistory.MINUTE, LoadHistory.HOUR, TruncHour),
+]
+
+
+def add_load_samples(now: datetime) -> int:
+    """
+    Append raw samples of current node load and tenant statistics.
+    """
+    samples = [LoadHistory(node=node, timestamp=now, attendees=node.attendees, meetings=node.meetings, cpu_load=node.cpu_load) for node in Node.objects.filter(has_errors=False)]
+    for row in Stats.objects.filter(tenant__isnull=False).values("tenant").annotate(sum_attendees=Sum("attendees"), sum_meetings=Sum("meetings")).order_by():
+        samples.append(LoadHistory(tenant_id=row["tenant"], timestamp=now, attendees=row["sum_attendees"], meetings=row["sum_meetings"]))
+    LoadHistory.objects.bulk_create(samples)
+    return len(samples)
+
+
+def rollup_load_history(source: int, target: int, trunc, now: datetime) -> int:
+    """
+    Roll up all complete intervals of source resolution samples, which are not rolled up yet, into peak values.
+    """
+    end = datetime.fromtimestamp(int(now.timestamp()) // target * target, tz=dt_timezone.utc)
+    samples = LoadHistory.objects.filter(resolution=source, timestamp__lt=end)
+    last = LoadHistory.objects.filter(resolution=target).aggregate(last=Max("timestamp"))["last"]
+    if last:
+        samples = samples.filter(timestamp__gte=last + timedelta(seconds=target))
+
+    rows = samples.annotate(bucket=trunc("timestamp", tzinfo=dt_timezone.utc)).values("node", "tenant", "bucket").annotate(max_attendees=Max("attendees"), max_meetings=Max("meetings"), max_cpu_load=Max("cpu_load")).order_by()
+    rollups = [LoadHistory(node_id=row["node"], tenant_id=row["tenant"], resolution=target, timestamp=row["bucket"], attendees=row["max_attendees"], meetings=row["max_meetings"], cpu_load=row["max_cpu_load"]) for row in rows]
+    LoadHistory.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def delete_expired_load_history(now: datetime) -> int:
+    retentions = {
+        LoadHistory.RAW: settings.B3LB_LOAD_HISTORY_RETENTION_RAW,
+        LoadHistory.MINUTE: settings.B3LB_LOAD_HISTORY_RETENTION_MINUTE,
+        LoadHistory.HOUR: settings.B3LB_LOAD_HISTORY_RETENTION_HOUR,
+    }
+    query = Q()
+    for resolution, days in retentions.items():
+        query |= Q(resolution=resolution, timestamp__lt=now - timedelta(days=days))
+    deleted, _ = LoadHistory.objects.filter(query).delete()
+    return deleted
+
+
+def update_load_history() -> str:
+    now = timezone.now()
+    samples = add_load_samples(now)
+    rollups = 0
+    with transaction.atomic():
+        for source, target, trunc in ROLLUPS:
+            rollups += rollup_load_history(source, target, trunc, now)
+    deleted = delete_expired_load_history(now)
+    return f"Added {samples} samples and {rollups} rollups, deleted {deleted} expired entries."
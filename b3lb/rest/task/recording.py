@@ -15,77 +15,194 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
+from botocore.exceptions import BotoCoreError, ClientError
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from django.utils import timezone as tz
 from django.conf import settings
-from os import makedirs, path
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Greatest, Least
+from math import ceil
+from os import makedirs, path, remove
 from requests import post
-from rest.models import Record, RecordSet, RecordProfile, SecretRecordProfileRelation
+from rest.b3lb.archive import get_extract_args
+from rest.b3lb.encoding import get_encoding_format
+from rest.b3lb.probe import ProbeCache
+from rest.b3lb.timeline import SECOND
+from rest.b3lb.upload import get_storage_key
+from rest.models import Record, RecordSet, RecordProfile, Secret, SecretRecordProfileRelation
+from rest.b3lb.render import CpuBudget, get_job_threads
+from shutil import copyfileobj
+from storages.backends.s3 import S3Storage
 from subprocess import DEVNULL, PIPE, Popen
 from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+from typing import Any, Dict, List, Set, Tuple
+
+# buffer size for streaming raw archives from the storage
+RAW_COPY_SIZE = 8388608
+
+RENDER_DIR = "/srv/rendering"
+# seconds between checks of running render jobs
+RENDER_POLL_INTERVAL = 2
+# seconds between heartbeats of running render jobs
+RENDER_HEARTBEAT_INTERVAL = 60
+
+# max. keys of a S3 DeleteObjects request
+S3_MAX_DELETE_KEYS = 1000
 
 if settings.B3LB_RENDERING:
     from rest.b3lb.make_xges import render_xges
     from jwt import encode as jwt_encode
 
-def render_by_profile(record_set: RecordSet, record_profile: RecordProfile, tempdir: str) -> str:
+def start_by_profile(record_set: RecordSet, record_profile: RecordProfile, tempdir: str, cpus: List[int], assets: Dict[str, Any]) -> Popen:
     """
-    Render RecordSet with given RecordProfile in tempdir with
+    Start rendering RecordSet with given RecordProfile in tempdir with
 
     tempdir/
-    |__ raw.tar
-    |__ in/
-    |__ out/
-    """
-    print(f"Start rendering {record_set.__str__()} with profile {record_profile.name}")
-    record, created = Record.objects.get_or_create(record_set=record_set, profile=record_profile, name=f"{record_set.meta_meeting_name} ({record_profile.description})")
+    |__ in/                 (extracted raw archive and probe cache, shared by all profiles)
+    |__ out/<profile name>/ (xges file, generated annotations and video of profile)
 
-    # unpack tar to IN folder
-    Popen(["tar", "-xf", f"{tempdir}/raw.tar", "-C", f"{tempdir}/in/"], stdin=DEVNULL, stdout=PIPE, close_fds=True).wait()
+    ges-launch is bound to the reserved CPUs, the encoder uses them as threads unless the profile sets encoder threads.
+    GES assets of the extracted files are shared by all profiles of the RecordSet using assets.
+    """
+    print(f"Start rendering {record_set.__str__()} with profile {record_profile.name} on {len(cpus)} CPUs")
+    out_dir = f"{tempdir}/out/{record_profile.name}"
+    makedirs(out_dir)
 
-    # generate xges file
-    render_xges(f"{tempdir}/in/", f"{tempdir}/out/video.xges", record_profile)
+    # generate xges file, the project contains the encoding format used for rendering
+    encoding_format = get_encoding_format(record_profile, len(cpus))
+    render_xges(f"{tempdir}/in/", f"{out_dir}/video.xges", record_profile, encoding_format, assets)
 
     # render by xges file
-    Popen(["ges-launch-1.0", "--load", f"{tempdir}/out/video.xges", "-o", f"{tempdir}/out/video.{record_profile.file_extension}"]).wait()
+    return Popen(["ges-launch-1.0", "--load", f"{out_dir}/video.xges", "-f", encoding_format, "-o", f"{out_dir}/video.{record_profile.file_extension}"], stdin=DEVNULL, close_fds=True, preexec_fn=CpuBudget.pin(cpus))
+
+
+def get_video_duration(tempdir: str) -> int:
+    """
+    Length of rendered videos in seconds, the timeline ends with the webcam video discovered by make_xges.
+    """
+    info = ProbeCache(f"{tempdir}/in/").get(f"{tempdir}/in/video/webcams.webm")
+    if info is None:
+        return 0
+    return round(info.duration / SECOND)
+
+
+def finish_by_profile(record_set: RecordSet, record_profile: RecordProfile, tempdir: str) -> str:
+    """
+    Store rendered video of RecordProfile as Record.
+    """
+    video = f"{tempdir}/out/{record_profile.name}/video.{record_profile.file_extension}"
 
     # check result
-    if not path.isfile(f"{tempdir}/out/video.{record_profile.file_extension}"):
-        raise Exception("No video output")
+    if not path.isfile(video):
+        raise Exception(f"No video output of profile {record_profile.name}")
 
     # create record entry
-    with open(f"{tempdir}/out/video.{record_profile.file_extension}", "rb") as video_file:
+    record, created = Record.objects.get_or_create(record_set=record_set, profile=record_profile, name=f"{record_set.meta_meeting_name} ({record_profile.description})")
+    # sizes and length are stored, so listings don't need storage lookups
+    record.file_size = path.getsize(video)
+    record.duration = get_video_duration(tempdir)
+    record.uploaded_at = tz.now()
+    with open(video, "rb") as video_file:
         if not created:
             record.file.delete()
         record.file.save(name=f"{record_set.file_path}/{record_profile.name}.{record_profile.file_extension}", content=video_file)
     record.published = True
     record.save()
+    remove(video)
     print(f"Finished rendering {record_set.__str__()} with profile {record_profile.name}")
     return str(record.uuid)
 
 
+def update_render_heartbeat(record_set: RecordSet):
+    """
+    Tell the scheduler, that the render job is alive. Raises if the RecordSet has been rescheduled in the meantime.
+    """
+    if not RecordSet.objects.filter(uuid=record_set.uuid, status=RecordSet.RENDERING).update(render_heartbeat_at=tz.now()):
+        raise Exception(f"Render job of {record_set.__str__()} has been rescheduled")
+
+
+def render_profiles(record_set: RecordSet, record_profiles: List[RecordProfile], tempdir: str) -> str:
+    """
+    Render profiles concurrently within the host wide CPU budget, each video is stored as soon as it is finished.
+    Returns uuid of the last stored Record.
+    """
+    budget = CpuBudget(f"{RENDER_DIR}/.cpus")
+    pending = list(record_profiles)
+    running: Dict[Popen, Tuple[RecordProfile, List[int]]] = {}
+    assets: Dict[str, Any] = {}
+    errors = []
+    record_id = ""
+    heartbeat = monotonic()
+
+    while pending or running:
+        if monotonic() - heartbeat >= RENDER_HEARTBEAT_INTERVAL:
+            heartbeat = monotonic()
+            try:
+                update_render_heartbeat(record_set)
+            except Exception:
+                # stop rendering, another worker renders the RecordSet now
+                for process, (record_profile, cpus) in running.items():
+                    process.kill()
+                    process.wait()
+                    budget.release(cpus)
+                raise
+
+        # start jobs while CPUs are available
+        while pending:
+            cpus = budget.acquire(get_job_threads(pending[0], len(budget.cpus)))
+            if not cpus:
+                break
+            record_profile = pending.pop(0)
+            try:
+                running[start_by_profile(record_set, record_profile, tempdir, cpus, assets)] = (record_profile, cpus)
+            except Exception as exception:
+                budget.release(cpus)
+                errors.append(f"{record_profile.name}: {exception}")
+
+        sleep(RENDER_POLL_INTERVAL)
+
+        # store finished jobs
+        for process in [process for process in running if process.poll() is not None]:
+            record_profile, cpus = running.pop(process)
+            budget.release(cpus)
+            try:
+                record_id = finish_by_profile(record_set, record_profile, tempdir)
+            except Exception as exception:
+                errors.append(f"{record_profile.name}: {exception}")
+
+    if errors:
+        raise Exception(f"Rendering of {record_set.__str__()} failed for profiles {', '.join(errors)}")
+    return record_id
+
+
 def render_record(record_set: RecordSet):
     if settings.B3LB_RENDERING:
         if record_set.get_raw_size() == 0:
-            print(f"raw.tar of {record_set.__str__()} empty or non existing!")
+            print(f"Raw archive of {record_set.__str__()} empty or non existing!")
             return False
 
         # create temporary directory
-        with TemporaryDirectory(dir="/srv/rendering") as tempdir:
+        with TemporaryDirectory(dir=RENDER_DIR) as tempdir:
             makedirs(f"{tempdir}/in")
             makedirs(f"{tempdir}/out")
 
-            with open(f"{tempdir}/raw.tar", "wb") as raw:
-                # download raw.tar
-                raw.write(record_set.recording_archive.file.read())
+            # stream raw archive to disk
+            with record_set.recording_archive.open("rb") as archive, open(f"{tempdir}/raw.tar", "wb") as raw:
+                copyfileobj(archive, raw, RAW_COPY_SIZE)
+            update_render_heartbeat(record_set)
 
-                # render with profiles
-                profile_relations = SecretRecordProfileRelation.objects.filter(secret=record_set.secret)
-                if profile_relations.count() > 0:
-                    for profile_relation in profile_relations:
-                        record_id = render_by_profile(record_set, profile_relation.record_profile, tempdir)
-                else:
-                    for record_profile in RecordProfile.objects.filter(is_default=True):
-                        record_id = render_by_profile(record_set, record_profile, tempdir)
+            # unpack tar (uncompressed or zstd) once to IN folder, the archive is not needed afterwards
+            Popen(get_extract_args(f"{tempdir}/raw.tar") + ["-C", f"{tempdir}/in/"], stdin=DEVNULL, stdout=PIPE, close_fds=True).wait()
+            remove(f"{tempdir}/raw.tar")
+            update_render_heartbeat(record_set)
+
+            # render with profiles
+            record_profiles = [relation.record_profile for relation in SecretRecordProfileRelation.objects.filter(secret=record_set.secret).select_related("record_profile")]
+            if not record_profiles:
+                record_profiles = list(RecordProfile.objects.filter(is_default=True))
+            record_id = render_profiles(record_set, record_profiles, tempdir)
 
         # implementation of recording ready callback url
         # https://docs.bigbluebutton.org/development/api/#recording-ready-callback-url
@@ -103,17 +220,206 @@ def render_record(record_set: RecordSet):
                 return False
 
         record_set.status = RecordSet.RENDERED
+        record_set.rendered_at = tz.now()
         record_set.save()
     return True
 
 
-def housekeeping_records():
-    for record_set in RecordSet.objects.all():
-        if record_set.status != RecordSet.DELETING and record_set.created_at < tz.now() - tz.timedelta(days=record_set.secret.records_effective_hold_time):
-            record_set.status = RecordSet.DELETING
-            record_set.save()
-    for record_set in RecordSet.objects.filter(status=RecordSet.DELETING):
-        for record in Record.objects.filter(record_set=record_set):
-            record.delete()
-        record_set.delete()
-    return True
+def set_render_failed(record_set: RecordSet, status: str):
+    """
+    Count failed render attempt, the RecordSet is retried after a backoff delay or set to FAILED after max attempts.
+    """
+    updated = RecordSet.objects.filter(uuid=record_set.uuid, status=status).update(status=RecordSet.UPLOADED, render_attempts=F("render_attempts") + 1, render_failed_at=tz.now())
+    if updated:
+        RecordSet.objects.filter(uuid=record_set.uuid, status=RecordSet.UPLOADED, render_attempts__gte=settings.B3LB_RENDER_MAX_ATTEMPTS).update(status=RecordSet.FAILED)
+
+
+def get_render_retry_at(record_set: RecordSet) -> Any:
+    """
+    Earliest time of next render attempt, None if there is no failed attempt.
+    """
+    if not record_set.render_failed_at or not record_set.render_attempts:
+        return None
+    return record_set.render_failed_at + tz.timedelta(minutes=settings.B3LB_RENDER_RETRY_DELAY * 2 ** (record_set.render_attempts - 1))
+
+
+def render_queued_record(record_set: RecordSet) -> bool:
+    """
+    Render RecordSet queued by the render scheduler.
+    Unsuccessful jobs are returned to the scheduler as UPLOADED with backoff, or set to FAILED after max attempts.
+    """
+    record_set.status = RecordSet.RENDERING
+    record_set.render_started_at = tz.now()
+    record_set.render_heartbeat_at = record_set.render_started_at
+    RecordSet.objects.filter(uuid=record_set.uuid).update(status=record_set.status, render_started_at=record_set.render_started_at, render_heartbeat_at=record_set.render_heartbeat_at)
+    rendered = False
+    try:
+        rendered = render_record(record_set)
+    finally:
+        if not rendered:
+            set_render_failed(record_set, RecordSet.RENDERING)
+    return rendered
+
+
+def get_render_order(record_set: RecordSet) -> Tuple[int, int, Any]:
+    """
+    Sort key of a tenant's render queue: higher priority, shorter recording, older upload first.
+    """
+    return -record_set.render_priority, record_set.get_duration(), record_set.created_at
+
+
+def schedule_render_jobs() -> List[str]:
+    """
+    Select uploaded RecordSets for rendering up to B3LB_RENDER_MAX_JOBS queued or running jobs.
+    Slots are handed out round robin to the tenants with the fewest active jobs, limited by B3LB_RENDER_MAX_JOBS_PER_TENANT.
+    Returns uuids of RecordSets set to QUEUED.
+    """
+    now = tz.now()
+
+    # reschedule queued jobs, which haven't been started by a worker
+    RecordSet.objects.filter(status=RecordSet.QUEUED, render_queued_at__lt=now - tz.timedelta(hours=settings.B3LB_RENDER_JOB_TIMEOUT)).update(status=RecordSet.UPLOADED)
+    # running jobs without heartbeat have lost their worker
+    heartbeat_limit = now - tz.timedelta(minutes=settings.B3LB_RENDER_HEARTBEAT_TIMEOUT)
+    lost = Q(render_heartbeat_at__lt=heartbeat_limit) | Q(render_heartbeat_at__isnull=True, render_started_at__lt=heartbeat_limit)
+    for record_set in RecordSet.objects.filter(lost, status=RecordSet.RENDERING):
+        set_render_failed(record_set, RecordSet.RENDERING)
+
+    active = Counter(RecordSet.objects.filter(status__in=[RecordSet.QUEUED, RecordSet.RENDERING]).values_list("secret__tenant", flat=True))
+    slots = settings.B3LB_RENDER_MAX_JOBS - sum(active.values())
+    if slots <= 0:
+        return []
+
+    queues: Dict[Any, List[RecordSet]] = {}
+    for record_set in RecordSet.objects.filter(status=RecordSet.UPLOADED).select_related("secret"):
+        # failed RecordSets wait for their retry
+        retry_at = get_render_retry_at(record_set)
+        if retry_at and retry_at > now:
+            continue
+        queues.setdefault(record_set.secret.tenant_id, []).append(record_set)
+    for queue in queues.values():
+        queue.sort(key=get_render_order)
+
+    scheduled = []
+    while slots > 0:
+        tenants = [tenant for tenant, queue in queues.items() if queue and active[tenant] < settings.B3LB_RENDER_MAX_JOBS_PER_TENANT]
+        if not tenants:
+            break
+        tenant = min(tenants, key=lambda tenant_id: (active[tenant_id], get_render_order(queues[tenant_id][0])))
+        record_set = queues[tenant].pop(0)
+        # claim RecordSet, unless it has been changed in the meantime
+        if RecordSet.objects.filter(uuid=record_set.uuid, status=RecordSet.UPLOADED).update(status=RecordSet.QUEUED, render_queued_at=now):
+            scheduled.append(str(record_set.uuid))
+            active[tenant] += 1
+            slots -= 1
+    return scheduled
+
+
+def get_render_queue() -> Dict[str, Any]:
+    """
+    Render queue depth per tenant with estimated time (seconds) until the queue is drained,
+    based on the average duration of the last rendered RecordSets.
+    """
+    durations = [(rendered_at - started_at).total_seconds() for started_at, rendered_at in RecordSet.objects.filter(rendered_at__isnull=False, render_started_at__isnull=False).order_by("-rendered_at").values_list("render_started_at", "rendered_at")[:20]]
+    average = sum(durations) / len(durations) if durations else 0
+
+    queue = {"uploaded": 0, "queued": 0, "rendering": 0, "failed": 0, "average_duration": round(average), "eta": 0, "tenants": {}}
+    statuses = {RecordSet.UPLOADED: "uploaded", RecordSet.QUEUED: "queued", RecordSet.RENDERING: "rendering", RecordSet.FAILED: "failed"}
+    for tenant, status in RecordSet.objects.filter(status__in=statuses).values_list("secret__tenant__slug", "status"):
+        queue["tenants"].setdefault(tenant, {"uploaded": 0, "queued": 0, "rendering": 0, "failed": 0, "eta": 0})
+        queue["tenants"][tenant][statuses[status]] += 1
+        queue[statuses[status]] += 1
+
+    slots = max(1, settings.B3LB_RENDER_MAX_JOBS)
+    queue["eta"] = round(ceil((queue["uploaded"] + queue["queued"] + queue["rendering"]) / slots) * average)
+    for tenant_queue in queue["tenants"].values():
+        tenant_slots = max(1, min(slots, settings.B3LB_RENDER_MAX_JOBS_PER_TENANT))
+        tenant_queue["eta"] = round(ceil((tenant_queue["uploaded"] + tenant_queue["queued"] + tenant_queue["rendering"]) / tenant_slots) * average)
+    return queue
+
+
+def get_effective_hold_time() -> Case:
+    """
+    SQL expression of Secret.records_effective_hold_time.
+    """
+    return Case(
+        When(Q(records_hold_time=0) | Q(tenant__records_hold_time=0), then=Greatest("records_hold_time", "tenant__records_hold_time")),
+        default=Least("records_hold_time", "tenant__records_hold_time"),
+    )
+
+
+def expire_record_sets() -> int:
+    """
+    Mark all expired RecordSets as DELETING with a single UPDATE.
+    Secrets are grouped by effective hold time, so expiry is one condition per distinct hold time.
+    """
+    now = tz.now()
+    secrets = Secret.objects.annotate(hold_time=get_effective_hold_time())
+    expired = Q()
+    for hold_time in secrets.values_list("hold_time", flat=True).distinct().order_by():
+        expired |= Q(secret__in=secrets.filter(hold_time=hold_time).values("uuid"), created_at__lt=now - tz.timedelta(days=hold_time))
+    if not expired:
+        return 0
+    return RecordSet.objects.filter(expired).exclude(status=RecordSet.DELETING).update(status=RecordSet.DELETING)
+
+
+def delete_storage_files(storage, names: List[str]) -> Set[str]:
+    """
+    Delete files from storage, S3 objects by DeleteObjects requests (1000 keys each) in parallel.
+    Returns names of files, which couldn't be deleted.
+    """
+    failed = set()
+    if isinstance(storage, S3Storage):
+        keys = {get_storage_key(storage, name): name for name in names}
+        client = storage.connection.meta.client
+
+        def delete_objects(batch: List[str]) -> List[str]:
+            response = client.delete_objects(Bucket=storage.bucket_name, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+            return [error["Key"] for error in response.get("Errors", []) if error.get("Code") != "NoSuchKey"]
+
+        batches = [list(keys)[index:index + S3_MAX_DELETE_KEYS] for index in range(0, len(keys), S3_MAX_DELETE_KEYS)]
+        with ThreadPoolExecutor(max(1, settings.B3LB_RECORD_DELETE_THREADS)) as executor:
+            for batch, future in [(batch, executor.submit(delete_objects, batch)) for batch in batches]:
+                try:
+                    failed.update(keys[key] for key in future.result())
+                except (BotoCoreError, ClientError) as exception:
+                    print(f"Deletion of {len(batch)} objects failed: {exception}")
+                    failed.update(keys[key] for key in batch)
+    else:
+        for name in names:
+            try:
+                storage.delete(name)
+            except NotImplementedError:
+                pass
+            except OSError:
+                failed.add(name)
+    return failed
+
+
+def delete_record_sets(uuids: List[str]) -> int:
+    """
+    Delete files of Records and raw archives of RecordSets in bulk, afterwards delete all rows, whose files are gone.
+    """
+    files: Dict[str, List[str]] = {}
+    for record_set_uuid, name in Record.objects.filter(record_set__in=uuids).exclude(file="").values_list("record_set", "file"):
+        files.setdefault(name, []).append(record_set_uuid)
+    for record_set_uuid, name in RecordSet.objects.filter(uuid__in=uuids).exclude(recording_archive="").values_list("uuid", "recording_archive"):
+        files.setdefault(name, []).append(record_set_uuid)
+
+    # record sets are kept for the next run, if a file couldn't be deleted
+    kept = set()
+    for name in delete_storage_files(Record.file.field.storage, list(files)):
+        kept.update(files[name])
+    deletable = [record_set_uuid for record_set_uuid in uuids if record_set_uuid not in kept]
+    Record.objects.filter(record_set__in=deletable).delete()
+    deleted, _ = RecordSet.objects.filter(uuid__in=deletable).delete()
+    return deleted
+
+
+def housekeeping_records() -> str:
+    expired = expire_record_sets()
+    deleted = 0
+    deleting = list(RecordSet.objects.filter(status=RecordSet.DELETING).values_list("uuid", flat=True))
+    batch_size = max(1, settings.B3LB_RECORD_DELETE_BATCH_SIZE)
+    for index in range(0, len(deleting), batch_size):
+        deleted += delete_record_sets(deleting[index:index + batch_size])
+    return f"Marked {expired} expired record sets, deleted {deleted} of {len(deleting)} record sets."
@@ -15,146 +15,107 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.template.loader import render_to_string
+from hashlib import sha1
+from json import dumps
 from rest.classes.statistics import MeetingStats
-from rest.models import Meeting, Metric, Node, Secret, SecretMetricsList, Stats, Tenant
-
-
-def update_secret_metrics(secret_uuid: str):
-    if secret_uuid:
-        secret_zero = Secret.objects.get(uuid=secret_uuid)
-        if secret_zero.sub_id == 0:
-            secrets = Secret.objects.filter(tenant=secret_zero.tenant)
-        else:
-            secrets = [secret_zero]
-        del secret_zero
-        template = "metrics_secret"
-        secret_text = secrets[0].__str__()
-    else:
-        secrets = Secret.objects.all()
-        template = "metrics_all"
-        secret_text = "all metrics."
-
-    metric_count = 0
-
-    context = {
-        "nodes": [],
-        "secret_limits": [],
-        "tenant_limits": [],
-        "metrics": {},
-        "metric_helps": {x[0]: x[1] for x in Metric.NAME_CHOICES},
-        "metric_gauges": Metric.GAUGES,
-    }
-
-    if not secret_uuid:
-        nodes = Node.objects.all()
-        for node in nodes:
-            context["nodes"].append([node.slug, node.cluster.name, node.load])
-
-    for secret in secrets:
-        tenant_slug = secret.tenant.slug
-        if secret.sub_id == 0:
-            secret_slug = tenant_slug
-            context["secret_limits"].append([secret_slug, secret.attendee_limit, secret.meeting_limit])
-            context["tenant_limits"].append([secret_slug, secret.tenant.attendee_limit, secret.tenant.meeting_limit])
-        else:
-            secret_slug = secret.__str__()
-            context["secret_limits"].append([secret_slug, secret.attendee_limit, secret.meeting_limit])
-        if secret.sub_id != 0:
-            metrics = Metric.objects.filter(secret=secret)
-        else:
-            metrics = Metric.objects.filter(secret__tenant=secret.tenant)
-
-        # group metrics by name
-        for metric in metrics:
-            if metric.name not in context["metrics"]:
-                context["metrics"][metric.name] = {
-                    "name_choice": context["metric_helps"][metric.name],
-                    "secrets": {}
-                }
-
-            if secret_slug in context["metrics"][metric.name]["secrets"]:
-                context["metrics"][metric.name]["secrets"][secret_slug]["value"] += metric.value
-            else:
-                if secret_uuid:
-                    context["metrics"][metric.name]["secrets"][secret_slug] = {"value": metric.value}
-                else:
-                    context["metrics"][metric.name]["secrets"][secret_slug] = {"tenant": tenant_slug, "value": metric.value}
-                metric_count += 1
-
-    if secret_uuid:
-        with transaction.atomic():
-            obj, created = SecretMetricsList.objects.update_or_create(secret=secrets[0], defaults={'metrics': render_to_string(template_name=template, context=context)})
-    else:
-        with transaction.atomic():
-            obj, created = SecretMetricsList.objects.update_or_create(secret=None, defaults={'metrics': render_to_string(template_name=template, context=context)})
-
-    mode = "Update"
-    if created:
-        mode = "Create"
-    return f"{mode} list with {metric_count} metrics for {secret_text}."
-
-def update_tenant_statistics(tenant_uuid):
-    stats_combination = []
-    try:
-        tenant = Tenant.objects.get(uuid=tenant_uuid)
-    except ObjectDoesNotExist:
-        return {}
-
-    result = {tenant.slug: {}}
-
-    stats = Stats.objects.filter(tenant=tenant)
-    meetings_all = Meeting.objects.filter(secret__tenant=tenant)
-    statistics = MeetingStats()
-
-    # update existing stats
+from rest.models import NodeMeetingList, Stats, Tenant
+from time import time
+from typing import Any, Dict, List
+
+
+def get_tenant_statistics_json(stats: List[Stats]) -> str:
+    statistic = {}
     for stat in stats:
-        meetings_filter = meetings_all.filter(bbb_origin=stat.bbb_origin, bbb_origin_server_name=stat.bbb_origin_server_name)
-        stats_combination.append([stat.bbb_origin, stat.bbb_origin_server_name])
+        if stat.bbb_origin_server_name not in statistic:
+            statistic[stat.bbb_origin_server_name] = {}
+        statistic[stat.bbb_origin_server_name][stat.bbb_origin] = {
+            "participantCount": stat.attendees,
+            "listenerCount": stat.listenerCount,
+            "voiceParticipantCount": stat.voiceParticipantCount,
+            "moderatorCount": stat.moderatorCount,
+            "videoCount": stat.videoCount,
+            "meetingCount": stat.meetings
+        }
+    return dumps(statistic)
+
+
+def set_tenant_statistics_cache(tenant_uuids: List[str], stats: List[Stats]) -> Dict[str, Dict[str, Any]]:
+    """
+    Store pre-serialized b3lb_stats JSON with ETag and Last-Modified (unix time) of tenants in cache.
+    Last-Modified is kept as long as the JSON does not change.
+    Stats are serialized in a fixed order, so the reducer and a cache miss rebuild result in the same ETag.
+    """
+    tenant_stats = {tenant_uuid: [] for tenant_uuid in tenant_uuids}
+    for stat in sorted(stats, key=lambda stat: (str(stat.tenant_id), stat.bbb_origin_server_name, stat.bbb_origin)):
+        if str(stat.tenant_id) in tenant_stats:
+            tenant_stats[str(stat.tenant_id)].append(stat)
+
+    keys = {tenant_uuid: settings.B3LB_CACHE_STATS_PATTERN.format(tenant_uuid) for tenant_uuid in tenant_uuids}
+    cached = cache.get_many(keys.values())
+    now = int(time())
+
+    entries = {}
+    for tenant_uuid, tenant_stat in tenant_stats.items():
+        json = get_tenant_statistics_json(tenant_stat)
+        etag = f'"{sha1(json.encode()).hexdigest()}"'
+        previous = cached.get(keys[tenant_uuid])
+        last_modified = previous["last_modified"] if previous and previous["etag"] == etag else now
+        entries[keys[tenant_uuid]] = {"json": json, "etag": etag, "last_modified": last_modified}
+    cache.set_many(entries, timeout=settings.B3LB_CACHE_STATS_TIMEOUT)
+    return {tenant_uuid: entries[keys[tenant_uuid]] for tenant_uuid in tenant_uuids}
+
+
+def get_tenant_statistics(tenant_uuid: str) -> Dict[str, Any]:
+    """
+    Return cached b3lb_stats JSON of tenant, rebuilt from Stats on cache miss.
+    """
+    statistics = cache.get(settings.B3LB_CACHE_STATS_PATTERN.format(tenant_uuid))
+    if statistics is None:
+        statistics = set_tenant_statistics_cache([tenant_uuid], list(Stats.objects.filter(tenant_id=tenant_uuid)))[tenant_uuid]
+    return statistics
+
+
+def update_statistics() -> int:
+    """
+    Reduce the per tenant and origin partial statistics of all nodes (see NodeCheck.get_tenant_stats) into Stats.
+    Partials of nodes with errors are not counted, stats without running meetings are reset.
+    Returns the number of updated stats.
+    """
+    tenant_uuids = {str(tenant_uuid) for tenant_uuid in Tenant.objects.values_list("uuid", flat=True)}
+
+    aggregates = {}
+    for node_stats in NodeMeetingList.objects.filter(node__has_errors=False).values_list("stats", flat=True):
+        for tenant_uuid, servers in node_stats.items():
+            if tenant_uuid not in tenant_uuids:
+                continue
+            for bbb_origin_server_name, origins in servers.items():
+                for bbb_origin, values in origins.items():
+                    key = (tenant_uuid, bbb_origin, bbb_origin_server_name)
+                    if key not in aggregates:
+                        aggregates[key] = MeetingStats()
+                    aggregates[key].add_aggregated_stats(*values)
+
+    stats = {(str(stat.tenant_id), stat.bbb_origin, stat.bbb_origin_server_name): stat for stat in Stats.objects.filter(tenant__isnull=False)}
+    existing_stats = list(stats.values())
 
-        statistics.__init__()
+    # add new stats combinations
+    new_stats = []
+    for tenant_uuid, bbb_origin, bbb_origin_server_name in aggregates.keys() - stats.keys():
+        if bbb_origin and bbb_origin_server_name:
+            stat = Stats(tenant_id=tenant_uuid, bbb_origin=bbb_origin, bbb_origin_server_name=bbb_origin_server_name)
+            stats[(tenant_uuid, bbb_origin, bbb_origin_server_name)] = stat
+            new_stats.append(stat)
 
-        for meeting in meetings_filter:
-            if not meeting.node.has_errors:
-                statistics.add_meeting_stats(meeting.attendees, meeting.listenerCount, meeting.voiceParticipantCount, meeting.moderatorCount, meeting.videoCount)
-            meetings_all = meetings_all.exclude(id=meeting.id)
+    for key, stat in stats.items():
+        stat.set_values(aggregates.get(key, MeetingStats()))
 
-        stat.update_values(statistics)
+    with transaction.atomic():
+        Stats.objects.bulk_update(existing_stats, Stats.VALUE_FIELDS)
+        Stats.objects.bulk_create(new_stats)
 
-        if stat.bbb_origin_server_name not in result[tenant.slug]:
-            result[tenant.slug][stat.bbb_origin_server_name] = {}
-            if stat.bbb_origin not in result[tenant.slug][stat.bbb_origin_server_name]:
-                result[tenant.slug][stat.bbb_origin_server_name][stat.bbb_origin] = statistics.get_values()
+    set_tenant_statistics_cache(list(tenant_uuids), list(stats.values()))
 
-    # add new stats combinations
-    new_combinations = []
-    for meeting in meetings_all:
-        if [meeting.bbb_origin, meeting.bbb_origin_server_name] not in stats_combination and meeting.bbb_origin_server_name and meeting.bbb_origin and not meeting.node.has_errors:
-            new_combinations.append([meeting.bbb_origin, meeting.bbb_origin_server_name])
-            stat = Stats(tenant=tenant, bbb_origin=meeting.bbb_origin, bbb_origin_server_name=meeting.bbb_origin_server_name)
-            stat.save()
-            stats_combination.append([meeting.bbb_origin, meeting.bbb_origin_server_name])
-
-    # fill new combinations with data
-    for new_combination in new_combinations:
-        bbb_origin = new_combination[0]
-        bbb_origin_server_name = new_combination[1]
-        stat = Stats.objects.get(tenant=tenant, bbb_origin=bbb_origin, bbb_origin_server_name=bbb_origin_server_name)
-        meetings_filter = meetings_all.filter(bbb_origin=stat.bbb_origin, bbb_origin_server_name=stat.bbb_origin_server_name)
-
-        statistics.__init__()
-
-        for meeting in meetings_filter:
-            if not meeting.node.has_errors:
-                statistics.add_meeting_stats(meeting.attendees, meeting.listenerCount, meeting.voiceParticipantCount, meeting.moderatorCount, meeting.videoCount)
-
-        stat.update_values(statistics)
-
-        if stat.bbb_origin_server_name not in result[tenant.slug]:
-            result[tenant.slug][stat.bbb_origin_server_name] = {}
-            if stat.bbb_origin not in result[tenant.slug][stat.bbb_origin_server_name]:
-                result[tenant.slug][stat.bbb_origin_server_name][stat.bbb_origin] = statistics.get_values()
-
-    return result
+    return len(stats)
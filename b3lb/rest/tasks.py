@@ -19,8 +19,11 @@ from celery.utils.log import get_task_logger
 from celery_singleton import Singleton
 from django.conf import settings as st
 from loadbalancer.celery import app
-from rest.models import Node, RecordSet, Secret, Tenant
-from rest.task.recording import housekeeping_records
+from rest.b3lb.metrics import flush_metric_buffer
+from rest.models import Node, Secret
+from rest.task.history import update_load_history
+from rest.task.recording import housekeeping_records, schedule_render_jobs
+from rest.task.statistics import update_statistics
 import rest.task.b3lb as b3lbtask
 
 
@@ -33,11 +36,12 @@ def update_secrets_lists():
     Async starting of secret list update tasks.
     """
     counter = 0
-    b3lbtask.statistic_update_secret_metrics.si("").apply_async()
+    if st.B3LB_METRIC_AGGREGATE_GAUGES:
+        b3lbtask.statistics_update_gauge_metrics.si().apply_async(queue=st.B3LB_TASK_QUEUE_STATISTICS)
+        counter += 1
     for secret in Secret.objects.all():
-        b3lbtask.statistic_update_secret_metrics.si(str(secret.uuid)).apply_async(queue=st.B3LB_TASK_QUEUE_STATISTICS)
         b3lbtask.core_generate_secret_meetings.si(str(secret.uuid)).apply_async(queue=st.B3LB_TASK_QUEUE_CORE)
-        counter += 2
+        counter += 1
     return f"Queue {counter} update list tasks."
 
 
@@ -53,26 +57,42 @@ def check_status():
     return f"Queue {counter} update check tasks."
 
 
+@app.task(name="Flush Metric Buffer", ignore_result=True, base=Singleton, queue=st.B3LB_TASK_QUEUE_STATISTICS)
+def flush_metrics():
+    """
+    Flush buffered metric increments into the database.
+    """
+    if not st.B3LB_METRIC_BUFFER:
+        return "Metric buffer is disabled."
+    return f"Flushed {flush_metric_buffer()} metric deltas."
+
+
 @app.task(name="Update Statistics", ignore_result=True, base=Singleton, queue=st.B3LB_TASK_QUEUE_STATISTICS)
 def update_statistic():
     """
-    Async starting of tenant statistic update.
+    Reduce node statistics partials into tenant statistics.
     """
-    counter = 0
-    for tenant in Tenant.objects.all():
-        b3lbtask.statistics_update_tenant_statistics.si(str(tenant.uuid)).apply_async(queue=st.B3LB_TASK_QUEUE_STATISTICS)
-        counter += 1
-    return f"Queue {counter} update statistic tasks."
+    return f"Updated {update_statistics()} statistics."
+
+
+@app.task(name="Update Load History", ignore_result=True, base=Singleton, queue=st.B3LB_TASK_QUEUE_STATISTICS)
+def update_history():
+    """
+    Sample node and tenant load, roll up and expire load history.
+    """
+    if not st.B3LB_LOAD_HISTORY:
+        return "Load history is disabled."
+    return update_load_history()
 
 
 @app.task(name="Render Records from RecordSets", ignore_result=True, base=Singleton, queue=st.B3LB_TASK_QUEUE_RECORD)
 def render_record():
     """
-    Async starting of rendering tasks.
+    Async starting of rendering tasks selected by the render scheduler.
     """
     counter = 0
-    for record_set in RecordSet.objects.filter(status=RecordSet.UPLOADED):
-        b3lbtask.recording_render_record.si(str(record_set.uuid)).apply_async(queue=st.B3LB_TASK_QUEUE_RECORD)
+    for record_set_uuid in schedule_render_jobs():
+        b3lbtask.recording_render_record.si(record_set_uuid).apply_async(queue=st.B3LB_TASK_QUEUE_RECORD)
         counter += 1
     return f"Queue {counter} rendering tasks."
 
@@ -15,11 +15,16 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotFound, HttpRequest, HttpResponseForbidden, FileResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import connection
 from django.db.utils import OperationalError
 from django.views.decorators.http import require_http_methods
+from prometheus_client import CONTENT_TYPE_LATEST
+from rest.b3lb.constants import HOST_REGEX
+from rest.b3lb.delivery import get_record_response
+from rest.b3lb.prometheus import RequestObserver, get_exposition
 from rest.classes.api import ClientB3lbRequest, NodeB3lbRequest
 from rest.classes.storage import DBStorage
 from rest.models import Asset, Record
@@ -31,14 +36,15 @@ async def bbb_entrypoint(request: HttpRequest, endpoint: str = "", slug: str = "
     """
     b3lb = ClientB3lbRequest(request, endpoint)
 
-    # async: workaround for @require_http_methods decorator
-    if not b3lb.is_allowed_method():
-        return HttpResponseNotAllowed(b3lb.allowed_methods())
+    with RequestObserver(b3lb.get_endpoint_label()):
+        # async: workaround for @require_http_methods decorator
+        if not b3lb.is_allowed_method():
+            return HttpResponseNotAllowed(b3lb.allowed_methods())
 
-    await b3lb.set_secret_by_slug_and_slug_id(slug, sub_id)
-    if not await sync_to_async(b3lb.is_authorized)():
-        return HttpResponse("Unauthorized", status=401)
-    return await b3lb.endpoint_delegation()
+        await b3lb.set_secret_by_slug_and_slug_id(slug, sub_id)
+        if not await sync_to_async(b3lb.is_authorized)():
+            return HttpResponse("Unauthorized", status=401)
+        return await b3lb.endpoint_delegation()
 
 # async: workaround for @csrf_exempt decorator
 bbb_entrypoint.csrf_exempt = True
@@ -80,6 +86,17 @@ async def metrics(request: HttpRequest, slug: str = "", sub_id: int = 0) -> Http
     return await b3lb.endpoint_delegation()
 
 
+# Operational prometheus endpoint
+# only available via base domain
+@require_http_methods(["GET"])
+def prometheus(request: HttpRequest) -> HttpResponse:
+    if not settings.B3LB_PROMETHEUS:
+        return HttpResponseNotFound()
+    if HOST_REGEX.sub(r'\1', request.META.get('HTTP_X_FORWARDED_HOST', request.META.get('HTTP_HOST'))) != settings.B3LB_API_BASE_DOMAIN:
+        return HttpResponse("Unauthorized", status=401)
+    return HttpResponse(get_exposition(), content_type=CONTENT_TYPE_LATEST)
+
+
 # Endpoint for getting slides for meeting
 # no default security
 @require_http_methods(['GET'])
@@ -132,11 +149,12 @@ def custom_css(request: HttpRequest, slug: str = "") -> HttpResponse:
         return HttpResponseNotFound()
 
 
-@require_http_methods(['GET'])
-def recording(request: HttpRequest, nonce: str = "") -> FileResponse:
+@require_http_methods(['GET', 'HEAD'])
+def recording(request: HttpRequest, nonce: str = "") -> HttpResponse:
     """
     Endpoint for downloading recording video files.
     No security like on BigBlueButton Nodes.
+    Delivery by B3LB_RECORD_DELIVERY: streamed with range support, redirected to S3 or handed over to nginx.
     """
     if not nonce:
         return FileResponse()
@@ -146,7 +164,7 @@ def recording(request: HttpRequest, nonce: str = "") -> FileResponse:
     except ObjectDoesNotExist:
         return FileResponse()
 
-    return FileResponse(record.file.open(), as_attachment=True, filename=f"video.{record.profile.file_extension}")
+    return get_record_response(request, record)
 
 
 async def backend_endpoint(request: HttpRequest, backend: str, endpoint: str) -> HttpResponse: